@@ -0,0 +1,133 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""asyncio access to the abstract build system.
+
+This lets one process drive many source trees at once - e.g. querying
+metadata and build_requires for hundreds of projects from a single event
+loop. Requires Python 3.7 or newer; the rest of setuptools_shim does not
+import this module, so older Pythons are unaffected.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import subprocess
+import sys
+
+from setuptools_shim import main
+from setuptools_shim import usage
+
+
+class AsyncBuildSystem(object):
+    """Coroutine versions of the AbstractBuildSystem queries.
+
+    Command lines, environments, cache lookups and output parsing are all
+    delegated to the wrapped AbstractBuildSystem, so the two stay in lock
+    step; only process management differs.
+
+    :attr build: The wrapped AbstractBuildSystem.
+    """
+
+    def __init__(self, build, limit=None):
+        """Create an AsyncBuildSystem.
+
+        :param build: An AbstractBuildSystem.
+        :param limit: Optional asyncio.Semaphore bounding the number of
+            backend processes running at once. Share one semaphore between
+            many AsyncBuildSystems to apply a global limit.
+        """
+        self.build = build
+        self._limit = limit
+
+    async def build_requires(self):
+        out = await self._run_command(['build_requires'])
+        return self.build._parse_build_requires(out)
+
+    async def metadata(self):
+        loop = asyncio.get_running_loop()
+        # Cache lookups stat the tree and may talk HTTP, so they run on the
+        # executor too.
+        out, store = await loop.run_in_executor(
+            None, self.build._cached, 'metadata')
+        if out is None:
+            out = await self._run_command(['metadata'])
+            if store is not None:
+                await loop.run_in_executor(None, store, out)
+        return self.build._parse_metadata_bytes(out)
+
+    async def wheel(self, outputdir=None):
+        loop = asyncio.get_running_loop()
+        fname, store = await loop.run_in_executor(
+            None, self.build._cached, 'wheel', outputdir)
+        if fname is None:
+            await self._run_command(
+                self.build._wheel_command(outputdir), stdout=None)
+            fname = self.build._find_wheel(outputdir)
+            if store is not None:
+                await loop.run_in_executor(None, store, fname)
+        return fname
+
+    async def _run_command(self, command, stdout=subprocess.PIPE):
+        if self._limit is None:
+            return await self._spawn(command, stdout)
+        async with self._limit:
+            return await self._spawn(command, stdout)
+
+    async def _spawn(self, command, stdout):
+        # asyncio's child watchers reap processes with waitpid and discard
+        # their rusage, so the blocking usage.run is pushed to an executor
+        # thread instead of using asyncio.create_subprocess_exec.
+        cmd = self.build._command_line(command)
+        proc_env = self.build._command_env()
+        loop = asyncio.get_running_loop()
+        try:
+            sys.stderr.write("Running %s\n" % " ".join(cmd))
+            out, used = await loop.run_in_executor(
+                None, functools.partial(
+                    usage.run, cmd, self.build.root, proc_env, stdout))
+        except OSError as err:
+            raise Exception("%r failed, %r" % (cmd, err))
+        main._check_usage(cmd, out, used)
+        return out
+
+
+async def gather(calls, limit):
+    """Run coroutine factories with at most limit running at once.
+
+    :param calls: An iterable of zero-argument callables returning
+        awaitables, e.g. ``[AsyncBuildSystem(b).metadata for b in builds]``.
+    :param limit: The maximum number of calls in flight.
+    :return: A list of results, in the same order as calls. The first
+        exception raised by any call propagates.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(call):
+        async with semaphore:
+            return await call()
+    return await asyncio.gather(*[bounded(call) for call in calls])
+
+
+def run(calls, limit=8):
+    """Synchronous entry point for gather().
+
+    The event loop gets an executor with one thread per permitted call, so
+    the executor never becomes the effective limit.
+
+    :return: A list of results, in the same order as calls.
+    """
+    async def _run():
+        asyncio.get_running_loop().set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(limit))
+        return await gather(calls, limit)
+    return asyncio.run(_run())
@@ -0,0 +1,164 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Local cache of direct reference build requirements.
+
+Build requirements like ``tool @ file:///srv/tool-1.0.tar.gz`` or
+``tool @ git+https://example.com/tool@v1.0`` are fetched - or for VCS and
+directory references, built into a wheel - once, and kept in the
+artifacts/ directory of the shim's work directory (see
+setuptools_shim.cache.work_dir). Each artifact gets its own directory,
+which is offered to setup_requires as a find-links location.
+
+Entries are keyed by the URL and, when the URL carries a
+``#sha256=<hex>`` fragment, that hash: archives are verified against it
+before being cached. Local directories are also keyed by their
+fingerprint, so edits are picked up. Other references are cached as first
+fetched; pin VCS references to a commit or tag.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from setuptools_shim import cache
+
+
+ARCHIVE_EXTENSIONS = ('.whl', '.tar.gz', '.tgz', '.tar.bz2', '.zip')
+
+_VCS_SCHEMES = ('git+', 'hg+', 'svn+', 'bzr+')
+
+_WHEEL_RE = re.compile(r'^(?P<name>.+?)-(?P<version>\d[^-]*)(-\d[^-]*)?-[^-]+'
+                       r'-[^-]+-[^-]+\.whl$')
+_SDIST_RE = re.compile(r'^(?P<name>.+)-(?P<version>\d[^-]*)'
+                       r'\.(tar\.gz|tgz|tar\.bz2|zip)$')
+
+
+def artifact_version(filename):
+    """Return the version in a wheel or sdist filename, or None."""
+    match = _WHEEL_RE.match(filename) or _SDIST_RE.match(filename)
+    if match is None:
+        return None
+    return match.group('version')
+
+
+def _split_hash(url):
+    """Return (url without a hash fragment, hex sha256 or None)."""
+    base, _, fragment = url.partition('#')
+    for part in fragment.split('&'):
+        if part.startswith('sha256='):
+            return base, part[len('sha256='):].lower()
+    return url, None
+
+
+def _file_path(url):
+    if url.startswith('file://'):
+        try:
+            from urllib.request import url2pathname
+        except ImportError:
+            from urllib import url2pathname
+        return url2pathname(url[len('file://'):])
+    return None
+
+
+class ArtifactCache(object):
+    """Fetched and built direct reference artifacts.
+
+    :attr path: The directory entries are stored in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        return cls(os.path.join(cache.work_dir(environ), 'artifacts'))
+
+    def fetch(self, url):
+        """Return a directory holding the artifact for url.
+
+        :raises Exception: If the artifact does not match a pinned hash, or
+            cannot be fetched or built.
+        """
+        base, pinned = _split_hash(url)
+        local = _file_path(base)
+        is_dir = local is not None and os.path.isdir(local)
+        is_vcs = base.startswith(_VCS_SCHEMES)
+        if pinned and (is_dir or is_vcs):
+            raise Exception(
+                "Hashes can only be pinned for archives, not %r" % (url,))
+        if not (is_dir or is_vcs) and not base.endswith(ARCHIVE_EXTENSIONS):
+            raise Exception("Unsupported direct reference %r" % (url,))
+        key_parts = [base, pinned or '']
+        if is_dir:
+            from setuptools_shim import fingerprint
+            key_parts.append(fingerprint.Fingerprint(local).digest())
+        key = hashlib.sha256(
+            '\0'.join(key_parts).encode('utf-8')).hexdigest()
+        entry = os.path.join(self.path, key[:2], key)
+        if os.path.isdir(entry):
+            return entry
+        staging = tempfile.mkdtemp()
+        try:
+            if is_dir or is_vcs:
+                self._build(local if is_dir else base, staging)
+            else:
+                self._download(base, local, pinned, staging)
+            cache.ensure_dir(os.path.dirname(entry))
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                # Another process got there first.
+                if not os.path.isdir(entry):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return entry
+
+    def _download(self, url, local, pinned, staging):
+        target = os.path.join(staging, url.rsplit('/', 1)[-1])
+        sys.stderr.write("Fetching %s\n" % (url,))
+        if local is not None:
+            shutil.copyfile(local, target)
+        else:
+            try:
+                from urllib.request import urlopen
+            except ImportError:
+                from urllib2 import urlopen
+            response = urlopen(url)
+            try:
+                with open(target, 'wb') as output:
+                    shutil.copyfileobj(response, output)
+            finally:
+                response.close()
+        if pinned:
+            digest = hashlib.sha256()
+            with open(target, 'rb') as source:
+                for block in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(block)
+            if digest.hexdigest() != pinned:
+                raise Exception("%s has sha256 %s, expected %s" % (
+                    url, digest.hexdigest(), pinned))
+
+    def _build(self, source, staging):
+        command = [
+            sys.executable, '-m', 'pip', 'wheel', '--no-deps', '-w', staging,
+            source]
+        sys.stderr.write("Running %s\n" % " ".join(command))
+        try:
+            subprocess.check_call(command, stdout=sys.stderr)
+        except (OSError, subprocess.CalledProcessError) as err:
+            raise Exception("%r failed, %r" % (command, err))
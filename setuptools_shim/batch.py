@@ -0,0 +1,176 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Build and install many source trees with one pip run.
+
+Usage: python -m setuptools_shim.batch [--jobs N] [--no-deps]
+    [--record-dir DIR] [--pip-option=OPT ...] TREE [TREE ...]
+
+Installing N trees through pip and the shim's setup.py costs N pip
+processes on top of N builds. This builds a wheel for every tree, up to
+--jobs at a time, then installs them all with a single pip install.
+
+Each tree gets an isolated build environment (see setuptools_shim.buildenv)
+whatever SETUPTOOLS_SHIM_ISOLATED says: setup_requires installs into the
+running process, which cannot serve several trees at once. Wheels come
+from and go to the shim's caches as usual.
+
+With --record-dir, the absolute paths of the files each project installed
+are written to DIR/<name>-<version>-record.txt, one per line, as for
+``setup.py install --record``. Unlike setup.py install, the installs are
+left as pip made them: there is no parent pip to take over an .egg-info,
+and pip uninstall needs the .dist-info. The records are read from where
+the --pip-option --target, --prefix, --root or --user options put the
+files; other ways of moving them, such as PIP_TARGET, are not followed,
+and then no record is found.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+from setuptools_shim import main as shim_main
+
+
+def build_wheels(roots, outputdir, jobs=4):
+    """Build a wheel for each source tree.
+
+    :param roots: Source tree paths.
+    :param outputdir: Wheels are written to numbered directories in here.
+    :param jobs: How many trees to build at once.
+    :return: A list of wheel paths, in the same order as roots. The first
+        exception raised by any build propagates.
+    """
+    from multiprocessing.pool import ThreadPool
+
+    def build_one(item):
+        index, root = item
+        build = shim_main.AbstractBuildSystem(os.path.abspath(root))
+        shim_main._prepare_isolated_env(build)
+        # One directory per tree, so each wheel is found unambiguously.
+        target = os.path.join(outputdir, str(index))
+        os.mkdir(target)
+        return build.wheel(target)
+
+    pool = ThreadPool(max(1, min(jobs, len(roots))))
+    try:
+        return pool.map(build_one, list(enumerate(roots)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def install(wheels, no_deps=False, pip_options=()):
+    """Install wheels with a single pip run."""
+    command = [sys.executable, '-m', 'pip', 'install']
+    if no_deps:
+        command.append('--no-deps')
+    command.extend(pip_options)
+    command.extend(wheels)
+    sys.stderr.write("Running %s\n" % " ".join(command))
+    try:
+        subprocess.check_call(command, stdout=sys.stderr)
+    except (OSError, subprocess.CalledProcessError) as err:
+        raise Exception("%r failed, %r" % (command, err))
+
+
+# pip install options that decide where files go, and whether they take a
+# value.
+_LOCATION_OPTIONS = {
+    '--target': True, '-t': True, '--prefix': True, '--root': True,
+    '--user': False,
+    }
+
+
+def lib_dirs(name, pip_options=()):
+    """Return where pip install with pip_options puts name's modules.
+
+    :return: A list of candidate directories, most likely first.
+    """
+    found = {}
+    options = list(pip_options)
+    while options:
+        option = options.pop(0)
+        key, eq, value = option.partition('=')
+        if key.startswith('-t') and key != '-t':
+            # -tDIR
+            key, value, eq = '-t', key[2:], '='
+        if key not in _LOCATION_OPTIONS:
+            continue
+        if not _LOCATION_OPTIONS[key]:
+            found[key] = True
+        elif eq:
+            found[key] = value
+        elif options:
+            found[key] = options.pop(0)
+        else:
+            raise Exception("%s needs a value" % (key,))
+    target = found.get('--target') or found.get('-t')
+    if target:
+        return [target]
+    from setuptools_shim import frompip
+    scheme = frompip.distutils_scheme(
+        name, user=found.get('--user', False), root=found.get('--root'),
+        prefix=found.get('--prefix'))
+    return [scheme['purelib'], scheme['platlib']]
+
+
+def write_records(names, record_dir, pip_options=()):
+    """Write the install record of each installed project to record_dir.
+
+    :param names: (name, namever) pairs, from main._parse_wheel_name.
+    """
+    from setuptools_shim import cache
+    cache.ensure_dir(record_dir)
+    for name, namever in names:
+        lib_dir, paths = shim_main._installed_record(
+            namever, lib_dirs(name, pip_options))
+        with open(os.path.join(record_dir, namever + '-record.txt'),
+                  'wt') as record_file:
+            record_file.writelines(
+                os.path.join(lib_dir, path) + '\n' for path in paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build and install many pypa.json source trees.")
+    parser.add_argument('trees', nargs='+', metavar='TREE')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=4,
+        help="How many trees to build at once (default 4).")
+    parser.add_argument(
+        '--no-deps', action='store_true',
+        help="Do not install the dependencies of the trees.")
+    parser.add_argument(
+        '--record-dir', metavar='DIR',
+        help="Write the files each project installed to "
+        "DIR/<name>-<version>-record.txt.")
+    parser.add_argument(
+        '--pip-option', action='append', default=[], metavar='OPT',
+        help="Pass OPT to pip install, e.g. --pip-option=--no-index.")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    with shim_main.TempDir() as tempdir:
+        wheels = build_wheels(args.trees, tempdir, args.jobs)
+        install(wheels, args.no_deps, args.pip_option)
+        names = [shim_main._parse_wheel_name(wheel) for wheel in wheels]
+    if args.record_dir:
+        write_records(names, args.record_dir, args.pip_option)
+    for tree, (name, namever) in zip(args.trees, names):
+        sys.stdout.write("%s (%s)\n" % (namever, tree))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
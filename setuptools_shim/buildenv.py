@@ -0,0 +1,184 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Isolated build environments.
+
+With SETUPTOOLS_SHIM_ISOLATED=1 the bootstrap and build requirements are
+not installed into the running process with setup_requires. Instead pip
+installs exactly those requirements into a prefix under envs/ in the shim's
+work directory (see setuptools_shim.cache.work_dir), and the backend gets a
+PYTHONPATH computed from that prefix alone: the prefix itself plus the
+directories its .pth files name, deduplicated.
+Nothing inherited from the caller's PYTHONPATH or the user site directory
+reaches the backend. The prefix's bin/ goes first on PATH, so console
+scripts installed with the requirements are found before any others.
+
+Prefixes are keyed by the requirement set and the running Python, and are
+reused as-is once complete.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from setuptools_shim import cache
+
+
+# Written last: a prefix without it is incomplete and is rebuilt.
+MANIFEST_NAME = '.setuptools_shim-env.json'
+
+
+def isolated(environ=None):
+    """Return True if isolated build environments are enabled."""
+    if environ is None:
+        environ = os.environ
+    return environ.get('SETUPTOOLS_SHIM_ISOLATED', '') not in (
+        '', '0', 'false', 'no')
+
+
+def env_key(requirements, links=()):
+    """Return the key for a prefix holding requirements on this Python."""
+    digest = hashlib.sha256()
+    for item in sorted(requirements) + ['\0'] + sorted(links):
+        digest.update(item.encode('utf-8') + b'\0')
+    return cache.wheel_key(digest.hexdigest())
+
+
+def dedupe_path(entries):
+    """Return entries without empty or repeated items, order preserved."""
+    seen = set()
+    result = []
+    for entry in entries:
+        if not entry:
+            continue
+        key = os.path.normcase(os.path.abspath(entry))
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(entry)
+    return result
+
+
+def _pth_entries(prefix):
+    """Return the directories named by .pth files in prefix.
+
+    Lines that run code (``import ...``) are skipped: they exist for
+    namespace packages on old Pythons, and running them would need site.
+    """
+    entries = []
+    for name in sorted(os.listdir(prefix)):
+        if not name.endswith('.pth'):
+            continue
+        with open(os.path.join(prefix, name), 'rt') as pth:
+            for line in pth:
+                line = line.strip()
+                if not line or line.startswith(('#', 'import ', 'import\t')):
+                    continue
+                path = os.path.join(prefix, line)
+                if os.path.isdir(path):
+                    entries.append(os.path.normpath(path))
+    return entries
+
+
+class BuildEnv(object):
+    """A prefix holding a build's requirements.
+
+    :attr path: The prefix directory.
+    :attr pythonpath: The list of directories the backend should import
+        from.
+    """
+
+    def __init__(self, path, pythonpath):
+        self.path = path
+        self.pythonpath = pythonpath
+
+    @classmethod
+    def load(cls, path):
+        """Return the BuildEnv at path, or None if it is not complete."""
+        try:
+            with open(os.path.join(path, MANIFEST_NAME), 'rt') as source:
+                manifest = json.load(source)
+        except (IOError, OSError, ValueError):
+            return None
+        return cls(path, [
+            os.path.normpath(os.path.join(path, entry))
+            for entry in manifest['pythonpath']])
+
+    @classmethod
+    def create(cls, requirements, links=(), environ=None):
+        """Return a BuildEnv with requirements installed, creating it if
+        needed.
+
+        :param requirements: Requirement strings, as pip accepts them.
+        :param links: Extra find-links locations. The cache wheelhouse is
+            always used when it exists.
+        """
+        key = env_key(requirements, links)
+        path = os.path.join(cache.work_dir(environ), 'envs', key[:2], key)
+        env = cls.load(path)
+        if env is not None:
+            return env
+        cache.ensure_dir(os.path.dirname(path))
+        staging = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            if requirements:
+                _pip_install(
+                    requirements,
+                    cache.dependency_links(environ) + list(links), staging)
+            # Relative, so the manifest stays valid after the rename.
+            pythonpath = dedupe_path(
+                ['.'] + [os.path.relpath(entry, staging)
+                         for entry in _pth_entries(staging)])
+            with open(os.path.join(staging, MANIFEST_NAME), 'wt') as output:
+                json.dump({
+                    'requirements': sorted(requirements),
+                    'links': sorted(links),
+                    'pythonpath': pythonpath,
+                    }, output)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                # Another process got there first.
+                if cls.load(path) is None:
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return cls.load(path)
+
+    def environ(self):
+        """Return the environment overrides for a backend using this env."""
+        return {
+            'PATH': os.pathsep.join([
+                os.path.join(self.path, 'bin'),
+                os.environ.get('PATH', os.defpath)]),
+            'PYTHONPATH': os.pathsep.join(self.pythonpath),
+            'PYTHONNOUSERSITE': '1',
+            }
+
+
+def _pip_install(requirements, links, target):
+    command = [sys.executable, '-m', 'pip', 'install', '--target', target]
+    for link in links:
+        command.extend(['--find-links', link])
+    command.extend(requirements)
+    sys.stderr.write("Running %s\n" % " ".join(command))
+    env = os.environ.copy()
+    # pip itself must not see a build's PYTHONPATH.
+    env.pop('PYTHONPATH', None)
+    try:
+        subprocess.check_call(command, stdout=sys.stderr, env=env)
+    except (OSError, subprocess.CalledProcessError) as err:
+        raise Exception("%r failed, %r" % (command, err))
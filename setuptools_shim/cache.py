@@ -0,0 +1,239 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Local caches used by the shim.
+
+The cache lives in SETUPTOOLS_SHIM_CACHE_DIR, or ~/.cache/setuptools_shim.
+It is only used once it exists - ``python -m setuptools_shim.prefetch``
+creates and fills it. It holds:
+
+ - wheelhouse/: wheels for bootstrap and build requirements, offered to
+   setup_requires as dependency links.
+ - metadata/: backend metadata, keyed by metadata_key.
+ - wheels/: wheels built from source trees, keyed by wheel_key.
+
+Entries may also be shared between machines, see setuptools_shim.remote.
+
+Direct reference artifacts and isolated build environments are always
+kept, and so live in a separate work directory (see work_dir): creating
+them does not turn the caches on.
+
+shim.py duplicates the location logic, as it runs before setuptools_shim
+is importable.
+"""
+
+import errno
+import os
+import sys
+
+
+def cache_dir(environ=None):
+    """Return the path of the cache, whether or not it exists."""
+    if environ is None:
+        environ = os.environ
+    path = environ.get('SETUPTOOLS_SHIM_CACHE_DIR')
+    if path:
+        return path
+    return os.path.join(os.path.expanduser('~'), '.cache', 'setuptools_shim')
+
+
+def work_dir(environ=None):
+    """Return where artifacts/ and envs/ are kept, whether or not it exists.
+
+    This is SETUPTOOLS_SHIM_WORK_DIR, or the cache path with -work
+    appended.
+    """
+    if environ is None:
+        environ = os.environ
+    path = environ.get('SETUPTOOLS_SHIM_WORK_DIR')
+    if path:
+        return path
+    return cache_dir(environ).rstrip(os.sep) + '-work'
+
+
+def wheelhouse(environ=None):
+    return os.path.join(cache_dir(environ), 'wheelhouse')
+
+
+def dependency_links(environ=None):
+    """Return dependency_links to pass to setup_requires."""
+    path = wheelhouse(environ)
+    if os.path.isdir(path):
+        return [path]
+    return []
+
+
+def _interpreter_key(tree_digest, *extra):
+    import hashlib
+    import platform
+    digest = hashlib.sha256(tree_digest.encode('ascii'))
+    for item in extra + (
+            platform.python_implementation(), sys.version_info[:2]):
+        digest.update(('\0%s' % (item,)).encode('ascii'))
+    return digest.hexdigest()
+
+
+def metadata_key(tree_digest):
+    """Return the cache key for metadata from a tree on this Python.
+
+    Backends may compute requirements with the running interpreter, e.g.
+    from sys.version_info, so metadata is keyed by the Python
+    implementation and version as well as the tree (see
+    setuptools_shim.fingerprint).
+    """
+    return _interpreter_key(tree_digest)
+
+
+def wheel_key(tree_digest):
+    """Return the cache key for wheels built from a tree on this Python.
+
+    As metadata_key, plus the platform: wheels may contain compiled code.
+    """
+    import sysconfig
+    return _interpreter_key(tree_digest, sysconfig.get_platform())
+
+
+class MetadataCache(object):
+    """Backend metadata, keyed by metadata_key.
+
+    :attr path: The directory entries are stored in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """Return the configured MetadataCache, or None if not in use."""
+        root = cache_dir(environ)
+        if not os.path.isdir(root):
+            return None
+        return cls(os.path.join(root, 'metadata'))
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        """Return the cached metadata bytes for key, or None."""
+        try:
+            with open(self._entry(key), 'rb') as source:
+                return source.read()
+        except (IOError, OSError):
+            return None
+
+    def put(self, key, metadata_bytes):
+        path = self._entry(key)
+        ensure_dir(os.path.dirname(path))
+        atomic_write(path, metadata_bytes)
+
+
+class WheelCache(object):
+    """Built wheels, keyed by wheel_key.
+
+    :attr path: The directory entries are stored in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """Return the configured WheelCache, or None if not in use."""
+        root = cache_dir(environ)
+        if not os.path.isdir(root):
+            return None
+        return cls(os.path.join(root, 'wheels'))
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        """Return the path of the cached wheel for key, or None."""
+        try:
+            names = os.listdir(self._entry(key))
+        except OSError:
+            return None
+        for name in names:
+            path = os.path.join(self._entry(key), name)
+            # Another user's entry may not be readable: that is a miss.
+            if name.endswith('.whl') and os.access(path, os.R_OK):
+                return path
+        return None
+
+    def put(self, key, wheel_path):
+        """Copy the wheel at wheel_path into the cache."""
+        path = self._entry(key)
+        ensure_dir(path)
+        with open(wheel_path, 'rb') as source:
+            atomic_write(
+                os.path.join(path, os.path.basename(wheel_path)),
+                source.read())
+
+
+def atomic_write(path, data, prefix='.tmp-'):
+    """Write data to path so that readers never see a partial file.
+
+    :param prefix: The temporary file's name prefix; it is created next to
+        path.
+    """
+    import tempfile
+    fd, temp = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=prefix)
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        # mkstemp makes the file private; caches are often filled by one
+        # user and read by another, so give it the mode open() would.
+        os.chmod(temp, 0o666 & ~_umask())
+        os.rename(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+_cached_umask = None
+
+
+def _umask():
+    """Return the process umask."""
+    global _cached_umask
+    if _cached_umask is None:
+        try:
+            # Linux 4.7+: reading it without changing it is thread safe.
+            with open('/proc/self/status', 'rt') as status:
+                for line in status:
+                    if line.startswith('Umask:'):
+                        _cached_umask = int(line.split()[1], 8)
+        except (IOError, OSError, ValueError):
+            pass
+    if _cached_umask is None:
+        _cached_umask = os.umask(0o022)
+        os.umask(_cached_umask)
+    return _cached_umask
+
+
+def ensure_dir(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def disk_usage(path):
+    """Return (files, bytes) under path."""
+    files = size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
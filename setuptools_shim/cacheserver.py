@@ -0,0 +1,183 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A small remote cache server, for tests and on-prem deployment.
+
+Usage: python -m setuptools_shim.cacheserver [--host H] [--port P] DIR
+
+Entries are stored as files under DIR. See setuptools_shim.remote for the
+protocol.
+
+Builders install and run whatever wheels the server hands out, so only
+holders of a shared token may store entries: PUTs must carry
+``Authorization: Bearer <token>``. The token is read from
+SETUPTOOLS_SHIM_REMOTE_TOKEN, as for the client; without one the server
+is read-only. GETs are not authenticated. The server listens on localhost
+unless --host says otherwise.
+"""
+
+import argparse
+import hashlib
+import hmac
+import os
+import re
+import sys
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from setuptools_shim import cache
+from setuptools_shim.remote import KINDS
+
+
+_PATH_RE = re.compile(r'^/(?P<kind>[a-z]+)/(?P<key>[0-9a-f]{64})$')
+_NAME_RE = re.compile(r'^[A-Za-z0-9_.+-]+$')
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def _entry(self):
+        match = _PATH_RE.match(self.path)
+        if not match or match.group('kind') not in KINDS:
+            self._reply(404)
+            return None
+        key = match.group('key')
+        return os.path.join(
+            self.server.root, match.group('kind'), key[:2], key)
+
+    def _reply(self, status, body=b'', name=None, sha256=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if sha256 is not None:
+            self.send_header('X-Shim-Sha256', sha256)
+        if name is not None:
+            self.send_header('X-Shim-Name', name)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        path = self._entry()
+        if path is None:
+            return
+        try:
+            with open(path, 'rb') as source:
+                body = source.read()
+        except (IOError, OSError):
+            self._reply(404)
+            return
+        name = None
+        if os.path.exists(path + '.name'):
+            with open(path + '.name', 'rt') as source:
+                name = source.read()
+        try:
+            # The hash accepted on PUT, so damage on disk shows too.
+            with open(path + '.sha256', 'rt') as source:
+                sha256 = source.read()
+        except (IOError, OSError):
+            sha256 = hashlib.sha256(body).hexdigest()
+        self._reply(200, body, name, sha256)
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        # Always consume the body, so the connection stays usable.
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if not self._authorized():
+            self._reply(403)
+            return
+        path = self._entry()
+        if path is None:
+            return
+        if (hashlib.sha256(body).hexdigest() !=
+                self.headers.get('X-Shim-Sha256')):
+            self._reply(400)
+            return
+        name = self.headers.get('X-Shim-Name')
+        if name is not None and not _NAME_RE.match(name):
+            self._reply(400)
+            return
+        cache.ensure_dir(os.path.dirname(path))
+        # Name and hash first: an entry is only visible once its body is
+        # renamed in.
+        if name is not None:
+            cache.atomic_write(path + '.name', name.encode('utf-8'))
+        sha256 = self.headers.get('X-Shim-Sha256')
+        cache.atomic_write(path + '.sha256', sha256.encode('ascii'))
+        cache.atomic_write(path, body)
+        self._reply(201)
+
+    def _authorized(self):
+        token = self.server.token
+        if not token:
+            return False
+        given = self.headers.get('Authorization') or ''
+        expected = 'Bearer ' + token
+        return hmac.compare_digest(
+            given.encode('utf-8'), expected.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class CacheServer(ThreadingMixIn, HTTPServer):
+    """A threaded cache server.
+
+    :attr root: The directory entries are stored in.
+    :attr token: The token PUTs must carry, or None for a read-only server.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root, address=('127.0.0.1', 0), verbose=False,
+                 token=None):
+        HTTPServer.__init__(self, address, CacheHandler)
+        self.root = root
+        self.verbose = verbose
+        self.token = token
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve a setuptools_shim remote cache.")
+    parser.add_argument('root', metavar='DIR')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args(argv)
+    cache.ensure_dir(args.root)
+    token = os.environ.get('SETUPTOOLS_SHIM_REMOTE_TOKEN') or None
+    server = CacheServer(
+        args.root, (args.host, args.port), verbose=True, token=token)
+    sys.stderr.write("Serving %s on %s%s\n" % (
+        args.root, server.url,
+        '' if token else " read-only: SETUPTOOLS_SHIM_REMOTE_TOKEN is unset"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
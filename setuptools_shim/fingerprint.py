@@ -0,0 +1,317 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Cheap 'has this source tree changed' answers.
+
+Hashing a whole tree on every setup.py call would cost more than the caches
+it keys save. Instead a stat index, like git's, is kept in the tree: files
+are only re-read when their size, mtime or inode change.
+
+An unchanged tree still costs one lstat per file, as it does for git
+status: without a filesystem monitor nothing else notices a file edited in
+place. On a 20k-file tree that measured 85-125ms warm (580ms cold), of
+which about 60ms is the lstat calls themselves; the index is a marshal
+file, which loads in about 8ms.
+
+.git is not hashed, but versions often come from it: pbr and
+setuptools_scm derive them from the commit and tags, which tagging a
+release changes without touching a file. So the digest also covers the
+git HEAD commit and every tag, read straight from the repository files.
+Other VCSes are not looked at.
+"""
+
+import errno
+import fnmatch
+import hashlib
+import marshal
+import os
+import re
+import stat
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+
+INDEX_NAME = '.setuptools_shim-fingerprint'
+
+# Build outputs and other files that never affect metadata or wheels.
+# Patterns starting with / only match at the top of the tree: a project may
+# well have a build/ or dist/ package of its own.
+IGNORE = [
+    '.git', '__pycache__', '*.egg-info', '*.pyc', '*.pyo',
+    '/.eggs', '/.tox', '/build', '/dist', '/*.whl',
+    '/' + INDEX_NAME, '/' + INDEX_NAME + '.*',
+    ]
+
+# Filesystem timestamp granularity we allow for. A file modified this close
+# to the index being written may change again without its mtime moving, so
+# it is always re-hashed ('racily clean' in git terms).
+RACY_NS = 2 * 10 ** 9
+
+_VERSION = 2
+
+
+def _matchers(patterns):
+    """Compile fnmatch patterns into (top, nested) match functions.
+
+    top is for names directly under the root, nested for everything below
+    it. Calling fnmatch per pattern per file dominates walking large trees,
+    so each is a single regex.
+    """
+    top = [pattern.lstrip('/') for pattern in patterns]
+    nested = [pattern for pattern in patterns if not pattern.startswith('/')]
+    return _compile(top), _compile(nested)
+
+
+def _compile(patterns):
+    if not patterns:
+        return lambda name: None
+    return re.compile(
+        '|'.join(fnmatch.translate(pattern) for pattern in patterns)).match
+
+
+def _key(st):
+    try:
+        mtime_ns = st.st_mtime_ns
+    except AttributeError:
+        mtime_ns = int(st.st_mtime * 10 ** 9)
+    return (st.st_size, mtime_ns, st.st_ino)
+
+
+def _walk_scandir(root, relroot, ignore, nested, result):
+    for entry in scandir(root):
+        name = entry.name
+        if ignore(name):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            _walk_scandir(
+                entry.path, relroot + name + '/', nested, nested, result)
+        else:
+            result[relroot + name] = _key(entry.stat(follow_symlinks=False))
+
+
+def _walk_listdir(root, relroot, ignore, nested, result):
+    for name in os.listdir(root):
+        if ignore(name):
+            continue
+        path = os.path.join(root, name)
+        relpath = relroot + name
+        st = os.lstat(path)
+        if stat.S_ISDIR(st.st_mode):
+            _walk_listdir(path, relpath + '/', nested, nested, result)
+        else:
+            result[relpath] = _key(st)
+
+
+def _hash(path):
+    """Return the sha256 of path, or None if it has been deleted since the
+    walk (e.g. a concurrent index write renaming its temp file).
+    """
+    try:
+        if os.path.islink(path):
+            return hashlib.sha256(
+                os.readlink(path).encode('utf-8')).hexdigest()
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for block in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(block)
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return None
+    return digest.hexdigest()
+
+
+def _git_dirs(root):
+    """Return (git_dir, common_dir) for the checkout holding root, or None.
+
+    common_dir holds the refs; it differs from git_dir in a worktree.
+    """
+    path = os.path.abspath(root)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+            break
+        if os.path.isfile(dot_git):
+            with open(dot_git, 'rt') as source:
+                line = source.read().strip()
+            if not line.startswith('gitdir:'):
+                return None
+            git_dir = os.path.join(path, line[len('gitdir:'):].strip())
+            break
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    common_dir = git_dir
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'rt') as source:
+            common_dir = os.path.join(git_dir, source.read().strip())
+    except (IOError, OSError):
+        pass
+    return git_dir, common_dir
+
+
+def _read(path):
+    try:
+        with open(path, 'rt') as source:
+            return source.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _packed_refs(common_dir):
+    refs = {}
+    packed = _read(os.path.join(common_dir, 'packed-refs')) or ''
+    for line in packed.splitlines():
+        if line.startswith(('#', '^')) or ' ' not in line:
+            continue
+        sha, name = line.split(' ', 1)
+        refs[name] = sha
+    return refs
+
+
+def vcs_state(root):
+    """Return a string identifying the git state versions may derive from.
+
+    This is HEAD's commit and every tag with what it points at, or '' if
+    root is not in a git checkout.
+    """
+    dirs = _git_dirs(root)
+    if dirs is None:
+        return ''
+    git_dir, common_dir = dirs
+    packed = _packed_refs(common_dir)
+    head = _read(os.path.join(git_dir, 'HEAD')) or ''
+    if head.startswith('ref:'):
+        ref = head[len('ref:'):].strip()
+        head = (_read(os.path.join(common_dir, ref)) or
+                packed.get(ref, ''))
+    tags = dict(
+        (name, sha) for name, sha in packed.items()
+        if name.startswith('refs/tags/'))
+    tags_dir = os.path.join(common_dir, 'refs', 'tags')
+    for dirpath, _, filenames in os.walk(tags_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            ref = 'refs/tags/' + os.path.relpath(
+                path, tags_dir).replace(os.sep, '/')
+            tags[ref] = _read(path) or ''
+    return '\n'.join(
+        ['HEAD %s' % head] +
+        ['%s %s' % (name, tags[name]) for name in sorted(tags)])
+
+
+class Fingerprint(object):
+    """A persistent fingerprint of a source tree.
+
+    :attr root: The tree.
+    :attr index_path: Where the stat index is kept.
+    :attr rehashed: The relative paths hashed by the last digest() call.
+    """
+
+    def __init__(self, root, ignore=IGNORE):
+        """Create a Fingerprint.
+
+        :param root: The root of the tree.
+        :param ignore: fnmatch patterns for file and directory names to
+            leave out; those starting with / only apply directly under
+            root. Matching directories are not descended into.
+        """
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._ignore = list(ignore)
+        self.rehashed = []
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as source:
+                index = marshal.loads(source.read())
+        except Exception:
+            # Missing, or written by another Python's marshal.
+            return None
+        if (not isinstance(index, dict) or
+                index.get('version') != _VERSION or
+                index.get('ignore') != self._ignore):
+            return None
+        return index
+
+    def _save(self, index):
+        from setuptools_shim import cache
+        try:
+            cache.atomic_write(
+                self.index_path, marshal.dumps(index),
+                prefix=INDEX_NAME + '.')
+        except (IOError, OSError):
+            # A read-only tree just doesn't get the speedup.
+            pass
+
+    def digest(self):
+        """Return a stable hex digest of the tree's content.
+
+        The digest covers the relative path and content of every
+        non-ignored file (symlinks by their target), and the vcs_state of
+        the checkout, if any.
+        """
+        content = self._content_digest()
+        state = vcs_state(self.root)
+        if not state:
+            return content
+        digest = hashlib.sha256(content.encode('ascii'))
+        digest.update(b'\0' + state.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _content_digest(self):
+        stats = {}
+        top, nested = _matchers(self._ignore)
+        if scandir is not None:
+            _walk_scandir(self.root, '', top, nested, stats)
+        else:
+            _walk_listdir(self.root, '', top, nested, stats)
+        index = self._load()
+        old_entries = index['entries'] if index else {}
+        racy_after = index['written'] - RACY_NS if index else 0
+        # entries map relpath to (size, mtime_ns, ino, sha256).
+        entries = {}
+        self.rehashed = []
+        for relpath, key in stats.items():
+            old = old_entries.get(relpath)
+            if old is not None and old[:3] == key and key[1] < racy_after:
+                entries[relpath] = old
+                continue
+            sha = _hash(os.path.join(self.root, relpath))
+            if sha is None:
+                continue
+            self.rehashed.append(relpath)
+            entries[relpath] = key + (sha,)
+        if (index and not self.rehashed and
+                len(entries) == len(old_entries)):
+            return index['digest']
+        digest = hashlib.sha256()
+        for relpath in sorted(entries):
+            digest.update(relpath.encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(entries[relpath][3].encode('ascii'))
+            digest.update(b'\n')
+        result = digest.hexdigest()
+        self._save({
+            'version': _VERSION,
+            'ignore': self._ignore,
+            'written': int(time.time() * 10 ** 9),
+            'digest': result,
+            'entries': entries,
+            })
+        return result
@@ -19,7 +19,6 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from distutils.command.install import SCHEME_KEYS
 import os
 import sys
 
@@ -41,6 +40,7 @@ def distutils_scheme(dist_name, user=False, home=None, root=None,
     """
     Return a distutils install scheme
     """
+    from distutils.command.install import SCHEME_KEYS
     from distutils.dist import Distribution
 
     scheme = {}
@@ -11,22 +11,19 @@
 # under the License.
 
 import contextlib
-import email.parser
 import errno
-import glob
 import os
 import json
 import re
-import shutil
 import subprocess
 import sys
-import tempfile
 
-from setuptools import setup
-from packaging.requirements import Requirement
-from pkg_resources import DistInfoDistribution, PathMetadata, DEVELOP_DIST
-
-from setuptools_shim import frompip
+# pip runs setup.py several times per package, and each command needs only
+# some of setuptools, pkg_resources, packaging, distutils and our own
+# helpers, so those are imported where they are used. See
+# setuptools_shim.tests.test_imports.
+from setuptools_shim import cache
+from setuptools_shim import usage
 
 def main(argv, orig_path):
     """CLI entry point for setuptools_shim.
@@ -41,59 +38,133 @@ def main(argv, orig_path):
        interface support in pip should land first, so this code will never be
        executed then.
 
-    Direct reference dependencies are not yet supported.
+    Direct reference build requirements are fetched via
+    setuptools_shim.artifacts.
     """
     # step 1, read pypa config
-    build = AbstractBuildSystem('.')
+    with _phase('config'):
+        build = AbstractBuildSystem('.')
     # step 2, install bootstrap requires and build requires
-    _prepare_build_env(build, orig_path)
+    with _phase('build_env'):
+        _prepare_build_env(build, orig_path)
     # step 3, do the requested command
-    if argv[1] == "egg_info":
-        return _egg_info(build, argv)
-    elif argv[1] == "develop":
-        return _develop(build, argv)
-    elif argv[1] == "install":
-        return _install(build, argv)
-    elif argv[1] == "bdist_wheel":
-        return _wheel(build, argv)
-    else:
-        raise Exception("Unknown command in %r" % (argv,))
+    with _phase(argv[1]):
+        if argv[1] == "egg_info":
+            return _egg_info(build, argv)
+        elif argv[1] == "develop":
+            return _develop(build, argv)
+        elif argv[1] == "install":
+            return _install(build, argv)
+        elif argv[1] == "bdist_wheel":
+            return _wheel(build, argv)
+        else:
+            raise Exception("Unknown command in %r" % (argv,))
+
+
+def _profiler():
+    """Return the current profiling.Profiler, or None."""
+    if not (os.environ.get('SETUPTOOLS_SHIM_PROFILE') or
+            os.environ.get('SETUPTOOLS_SHIM_PROFILE_RUN')):
+        return None
+    from setuptools_shim import profiling
+    return profiling.current()
+
+
+@contextlib.contextmanager
+def _phase(name):
+    # See setuptools_shim.profiling.
+    profiler = _profiler()
+    if profiler is None:
+        yield
+        return
+    with profiler.phase(re.sub(r'[^A-Za-z0-9_]', '_', name)):
+        yield
 
 
 def _new_pythonpath(orig_path):
     # Add the new things added to the path by setup_requires to PYTHONPATH
+    from setuptools_shim.buildenv import dedupe_path
     new_elements = sys.path[len(orig_path):]
     env_path = os.environ.get('PYTHONPATH', "")
-    if env_path:
-        new_env = os.pathsep.join([env_path] + new_elements) 
-    else:
-        new_env = os.pathsep.join(new_elements)
-    return new_env
+    return os.pathsep.join(
+        dedupe_path(env_path.split(os.pathsep) + new_elements))
 
 
 def _prepare_build_env(build, orig_path):
+    from setuptools_shim import buildenv
+    if buildenv.isolated():
+        return _prepare_isolated_env(build)
     # step 2, install bootstrap requires so we can invoke the actual build
-    # system.
+    # system. setuptools is only imported when there is something to
+    # install: the stage setup() calls cost more than most commands.
+    links = cache.dependency_links()
     if build.bootstrap_requires:
-        sys.argv = ['setup.py', 'test']
-        setup(name="stage2", setup_requires=build.bootstrap_requires)
+        _setup_requires("stage2", build.bootstrap_requires, links)
     build.force_pythonpath(_new_pythonpath(orig_path))
-    build_deps = build.build_requires()
+    active_deps, dep_links = _active_requirements(build.build_requires())
+    if active_deps:
+        _setup_requires("stage3", active_deps, dep_links + links)
+        build.force_pythonpath(_new_pythonpath(orig_path))
+
+
+def _setup_requires(name, requires, links):
+    from setuptools import setup
+    sys.argv = ['setup.py', 'test']
+    setup(name=name, setup_requires=requires, dependency_links=links)
+
+
+def _prepare_isolated_env(build):
+    # Nothing is installed into this process: the backend gets a prefix
+    # holding just its requirements. See setuptools_shim.buildenv.
+    from setuptools_shim import buildenv
+    bootstrap = list(build.bootstrap_requires)
+    build.use_build_env(buildenv.BuildEnv.create(bootstrap))
+    active_deps, dep_links = _active_requirements(build.build_requires())
+    build.use_build_env(
+        buildenv.BuildEnv.create(bootstrap + active_deps, dep_links))
+
+
+def _active_requirements(build_deps):
+    """Filter build requirements down to those needed right here.
+
+    Direct references are fetched into the artifact cache, and replaced by
+    a plain requirement plus a link to the cached artifact.
+
+    :param build_deps: A list of packaging Requirements.
+    :return: (requirements, links): a list of requirement strings, without
+        markers, and a list of find-links locations they need.
+    """
+    from setuptools_shim import reqindex
+    evaluator = reqindex.default_evaluator()
     active_deps = []
+    links = []
+    artifact_cache = None
     for dep in build_deps:
-        if dep._url:
-            raise Exception(
-                "Direct reference dependencies not supported. %r" % (dep,))
-        if not dep._marker or dep._marker.evaluate():
-            spec = dep._specifier or ''
-            extras = ('[%s]' % dep._extras) if dep._extras else ''
-            active_deps.append("%s%s%s" % (dep._name, extras, spec))
-    setup(name="stage3", setup_requires=active_deps)
-    build.force_pythonpath(_new_pythonpath(orig_path))
+        if not evaluator.evaluate(dep.marker):
+            continue
+        if not dep.url:
+            active_deps.append(reqindex.requirement_string(dep))
+            continue
+        from setuptools_shim import artifacts
+        if artifact_cache is None:
+            artifact_cache = artifacts.ArtifactCache.from_environ()
+        link = artifact_cache.fetch(dep.url)
+        links.append(link)
+        extras = '[%s]' % ','.join(sorted(dep.extras)) if dep.extras else ''
+        spec = ''
+        for fname in os.listdir(link):
+            version = artifacts.artifact_version(fname)
+            if version is not None:
+                # Don't let an index offer something newer.
+                spec = '==' + version
+                break
+        active_deps.append('%s%s%s' % (dep.name, extras, spec))
+    return active_deps, links
 
 
 def _egg_info(build, argv):
-    metadata = build.metadata()
+    from setuptools import setup
+    index = build.requirement_index()
     # Reconstruct setuptools kwargs from the metadata.
     # We don't try to preserve markers: if a wheel is being built, the actual
     # build system is responsible; our only job is to generate a plausible
@@ -101,17 +172,11 @@ def _egg_info(build, argv):
     # right-here, right-now.
     # We need to emit extras however, since we don't know which ones the
     # calling pip will decide on.
-    install_requires_set = set(str(r) for r in metadata.requires())
-    extras = {}
-    for extra in metadata.extras:
-        extra_reqs_set = set(str(r) for r in metadata.requires([extra]))
-        extra_reqs = [str(r) for r in (extra_reqs_set - install_requires_set)]
-        extras[extra] = extra_reqs
-    install_requires = [str(r) for r in install_requires_set]
+    install_requires, extras = index.resolve()
     sys.argv = argv
     setup(
-        name=metadata.project_name,
-        version=metadata.version,
+        name=index.name,
+        version=index.version,
         extras_require=extras,
         install_requires=install_requires)
     return 0
@@ -148,51 +213,83 @@ def _install(build, argv):
         # involved, we disable dependency handling - thats the parent pips
         # problem.
         command = [sys.executable, '-m', 'pip', '-v', 'install', '--no-deps', fname]
-        wheel_file_re = re.compile(
-            r"""^(?P<namever>(?P<name>.+?)-(?:\d.*?))
-            ((-(?:\d.*?))?-(?:.+?)-(?:.+?)-(?:.+?)
-            \.whl)$""",
-            re.VERBOSE
-        )
-        wheel_info = wheel_file_re.match(os.path.basename(fname))
-        if not wheel_info:
-            raise Exception("Could not determine wheel name from %r" % fname)
-        name = wheel_info.group('name').replace('_', '-')
-        build._run_command(command, stdout=None, use_prefix=False)
-        # Now that it is installed, make it look like a setuptools egg installed thing:
-        # -> rename the .dist-info directory to be .egg-info on disk
-        # -> transform RECORD to the install-record:
-        #    strip the hashes from each line - remove the last two ',' fields.
-        #    rename .dist-info to .egg-info
-        # -> convert from relative paths to absolute, as thats what pip expects
-        # find the path the wheel was installed into. 
-        scheme = frompip.distutils_scheme(name)
-        namever = wheel_info.group('namever')
-        info_name = namever + '.dist-info'
-        info_dir = scheme['purelib'] + '/' + info_name
+        name, namever = _parse_wheel_name(fname)
+        # pip installs into the environment we were run from, so it must
+        # not see the backend's build requirements.
+        build._run_command(
+            command, stdout=None, use_prefix=False, use_build_env=False)
+        _egg_info_install(name, namever, record_name)
+
+
+def _parse_wheel_name(fname):
+    """Return (name, namever) for the wheel at fname."""
+    wheel_file_re = re.compile(
+        r"""^(?P<namever>(?P<name>.+?)-(?:\d.*?))
+        ((-(?:\d.*?))?-(?:.+?)-(?:.+?)-(?:.+?)
+        \.whl)$""",
+        re.VERBOSE
+    )
+    wheel_info = wheel_file_re.match(os.path.basename(fname))
+    if not wheel_info:
+        raise Exception("Could not determine wheel name from %r" % fname)
+    return (
+        wheel_info.group('name').replace('_', '-'),
+        wheel_info.group('namever'))
+
+
+def _egg_info_install(name, namever, record_name):
+    """Make an installed wheel look like a setuptools egg installed thing.
+
+    :param name: The project name, from _parse_wheel_name.
+    :param namever: The wheel's name-version prefix, from _parse_wheel_name.
+    :param record_name: The install record file to write, as for
+        ``setup.py install --record``.
+    """
+    # -> rename the .dist-info directory to be .egg-info on disk
+    # -> transform RECORD to the install-record:
+    #    strip the hashes from each line - remove the last two ',' fields.
+    #    rename .dist-info to .egg-info
+    # -> convert from relative paths to absolute, as thats what pip expects
+    # find the path the wheel was installed into.
+    from setuptools_shim import frompip
+    scheme = frompip.distutils_scheme(name)
+    lib_dir, paths = _installed_record(
+        namever, [scheme['purelib'], scheme['platlib']])
+    info_dir = os.path.join(lib_dir, namever + '.dist-info')
+    new_lines = []
+    for path in paths:
+        path = path.replace('.dist-info', '.egg-info')
+        path = os.path.join(lib_dir, path)
+        new_lines.append(path + '\n')
+    with open(record_name, 'wt') as record_file:
+        record_file.writelines(new_lines)
+    # Delete the RECORD file, that is for .dist-info
+    os.unlink(info_dir + '/RECORD')
+    # Rename the .dist-info directory to .egg-info
+    egg_info = os.path.join(lib_dir, namever + '.egg-info')
+    os.rename(info_dir, egg_info)
+
+
+def _installed_record(namever, lib_dirs):
+    """Read the RECORD of an installed wheel.
+
+    :param namever: The wheel's name-version prefix, from _parse_wheel_name.
+    :param lib_dirs: Where it may have been installed; the first holding
+        its .dist-info is used.
+    :return: (lib_dir, paths): the paths RECORD lists, relative to lib_dir.
+    """
+    info_name = namever + '.dist-info'
+    for lib_dir in lib_dirs:
         try:
-            with open(info_dir + '/RECORD', 'rt') as record_file:
+            with open(os.path.join(lib_dir, info_name, 'RECORD'),
+                      'rt') as record_file:
                 record = record_file.readlines()
         except IOError as e:
-            if e.errno == errno.ENOENT:
-                info_dir = scheme['platlib'] + '/' + info_name
-                with open(info_dir + '/RECORD', 'rt') as record_file:
-                    record = record_file.readlines()
-        # process the lines
-        lib_dir = os.path.dirname(info_dir)
-        new_lines = []
-        for line in record:
-            name = line.rsplit(',', 2)[0]
-            name = name.replace('.dist-info', '.egg-info')
-            name = os.path.join(lib_dir, name)
-            new_lines.append(name + '\n')
-        with open(record_name, 'wt') as record_file:
-            record_file.writelines(new_lines)
-        # Delete the RECORD file, that is for .dist-info
-        os.unlink(info_dir + '/RECORD')
-        # Rename the .dist-info directory to .egg-info
-        egg_info = os.path.join(lib_dir, namever + '.egg-info')
-        os.rename(info_dir, egg_info)
+            if e.errno != errno.ENOENT:
+                raise
+            continue
+        return lib_dir, [line.rsplit(',', 2)[0] for line in record]
+    raise Exception("%s is not installed in any of %r" % (info_name, lib_dirs))
 
 
 def _wheel(build, argv):
@@ -209,6 +306,8 @@ def _wheel(build, argv):
 
 @contextlib.contextmanager
 def TempDir():
+    import shutil
+    import tempfile
     tempdir = tempfile.mkdtemp()
     try:
         yield tempdir
@@ -234,6 +333,7 @@ class AbstractBuildSystem(object):
             x.format(PYTHON=sys.executable)
             for x in self._pypa['build_command']]
         self._pythonpath = self._sentinel = object()
+        self._build_env = None
 
     def force_pythonpath(self, pythonpath):
         """Force PYTHONPATH to some specific value.
@@ -245,18 +345,29 @@ class AbstractBuildSystem(object):
         """
         self._pythonpath = pythonpath
 
+    def use_build_env(self, build_env):
+        """Run the backend in an isolated build environment.
+
+        :param build_env: A setuptools_shim.buildenv.BuildEnv, or None to
+            stop using one. Its environment overrides force_pythonpath.
+        """
+        self._build_env = build_env
+
+    def fingerprint(self):
+        """Return a digest of the source tree's content.
+
+        See setuptools_shim.fingerprint: this is cheap when nothing changed.
+        """
+        from setuptools_shim import fingerprint
+        return fingerprint.Fingerprint(self.root).digest()
+
     @property
     def bootstrap_requires(self):
         return self._pypa.get('bootstrap_requires', [])
 
     def build_requires(self):
         dependency_json_bytes = self._run_command(['build_requires'])
-        dependency_json = dependency_json_bytes.decode('utf-8')
-        dependencies = json.loads(dependency_json)
-        result = []
-        for dep in dependencies['build_requires']:
-            result.append(Requirement(dep))
-        return result
+        return self._parse_build_requires(dependency_json_bytes)
 
     def develop(self, prefix=None, root=None):
         command = ['develop']
@@ -270,17 +381,50 @@ class AbstractBuildSystem(object):
         metadata_bytes = self._metadata_bytes()
         return self._parse_metadata_bytes(metadata_bytes)
 
+    def requirement_index(self):
+        """Return a reqindex.RequirementIndex of the project's metadata.
+
+        Cheaper than metadata() when only the name, version and
+        requirements are needed.
+        """
+        from setuptools_shim import reqindex
+        return reqindex.RequirementIndex.from_metadata(self._metadata_bytes())
+
     def wheel(self, outputdir=None):
+        fname, store = self._cached('wheel', outputdir)
+        if fname is None:
+            self._run_command(self._wheel_command(outputdir), stdout=None)
+            fname = self._find_wheel(outputdir)
+            if store is not None:
+                store(fname)
+        return fname
+
+    def _wheel_command(self, outputdir):
         command = ['wheel']
         if outputdir is not None:
             command.extend(['-d', outputdir])
-        else:
+        return command
+
+    def _find_wheel(self, outputdir):
+        import glob
+        if outputdir is None:
             outputdir = '.'
-        self._run_command(command, stdout=None)
         fnames = glob.glob(outputdir + '/*.whl')
         return fnames[0]
 
+    def _parse_build_requires(self, dependency_json_bytes):
+        from packaging.requirements import Requirement
+        dependency_json = dependency_json_bytes.decode('utf-8')
+        dependencies = json.loads(dependency_json)
+        result = []
+        for dep in dependencies['build_requires']:
+            result.append(Requirement(dep))
+        return result
+
     def _parse_metadata_bytes(self, metadata_bytes):
+        import email.parser
+        from pkg_resources import (
+            DistInfoDistribution, PathMetadata, DEVELOP_DIST)
         # Make a temp wheel on disk. (Ugh, aiee, etc, but lets us avoid
         # reimplementing much of pkg_resources while still having its
         # normalisation etc.
@@ -288,7 +432,7 @@ class AbstractBuildSystem(object):
             metadata_path = os.path.join(tempdir, 'METADATA')
             with open(metadata_path, 'wb') as output:
                 output.write(metadata_bytes)
-            if sys.version_info < ('3',):
+            if sys.version_info >= (3,):
                 metadata_str = metadata_bytes.decode('utf-8')
             else:
                 metadata_str = metadata_bytes
@@ -305,30 +449,158 @@ class AbstractBuildSystem(object):
         return dist
 
     def _metadata_bytes(self):
-        return self._run_command(['metadata'])
-
-    def _run_command(self, command, stdout=subprocess.PIPE, use_prefix=True):
-        if use_prefix:
-            cmd = self._cmd_prefix + command
+        metadata_bytes, store = self._cached('metadata')
+        if metadata_bytes is None:
+            metadata_bytes = self._run_command(['metadata'])
+            if store is not None:
+                store(metadata_bytes)
+        return metadata_bytes
+
+    def _cached(self, kind, outputdir=None):
+        """Look up metadata or a wheel in the local and remote caches.
+
+        Shared by the sync and asyncio (setuptools_shim.aio) paths, which
+        differ only in how they run the backend on a miss.
+
+        :param kind: 'metadata' or 'wheel'.
+        :param outputdir: Where a cached wheel is copied to, as for wheel().
+        :return: (result, store). result is the metadata bytes or wheel path
+            on a hit, else None. store records what the backend produced on
+            a miss, and is None when no cache is configured.
+        """
+        if kind == 'metadata':
+            local = cache.MetadataCache.from_environ()
+        else:
+            local = cache.WheelCache.from_environ()
+        remote_cache = _remote_cache()
+        if local is None and remote_cache is None:
+            return None, None
+        if kind == 'metadata':
+            key = cache.metadata_key(self.fingerprint())
         else:
-            cmd = command
+            key = cache.wheel_key(self.fingerprint())
+        if kind == 'metadata':
+            result = local.get(key) if local else None
+            if result is None:
+                found = (
+                    remote_cache.get('metadata', key) if remote_cache
+                    else None)
+                if found is not None:
+                    result = found[0]
+                    if local:
+                        local.put(key, result)
+        else:
+            result = self._cached_wheel(local, remote_cache, key, outputdir)
+        if result is not None:
+            return result, None
+
+        def store(result):
+            if kind == 'metadata':
+                if remote_cache:
+                    remote_cache.put('metadata', key, result)
+                if local:
+                    local.put(key, result)
+                return
+            if local:
+                local.put(key, result)
+            if remote_cache:
+                with open(result, 'rb') as source:
+                    remote_cache.put(
+                        'wheel', key, source.read(), os.path.basename(result))
+        return None, store
+
+    def _cached_wheel(self, local, remote_cache, key, outputdir):
+        if outputdir is None:
+            target = '.'
+        else:
+            target = outputdir
+        cached = local.get(key) if local else None
+        if cached is not None:
+            import shutil
+            fname = os.path.join(target, os.path.basename(cached))
+            try:
+                shutil.copyfile(cached, fname)
+                return fname
+            except (IOError, OSError) as e:
+                # Unreadable, or removed since get(): a miss.
+                sys.stderr.write("Ignoring cached wheel %s: %s\n" % (
+                    cached, e))
+                if os.path.exists(fname):
+                    os.unlink(fname)
+        found = remote_cache.get('wheel', key) if remote_cache else None
+        if found is not None and _safe_wheel_name(found[1]):
+            fname = os.path.join(target, found[1])
+            with open(fname, 'wb') as output:
+                output.write(found[0])
+            if local:
+                local.put(key, fname)
+            return fname
+        return None
+
+    def _command_line(self, command, use_prefix=True):
+        if use_prefix:
+            return self._cmd_prefix + command
+        return command
+
+    def _command_env(self, use_build_env=True):
+        """Build the environment for a single backend invocation.
+
+        Each call gets its own copy: nothing is written back to os.environ,
+        so concurrent invocations cannot observe each other's settings.
+
+        :param use_build_env: Apply force_pythonpath and use_build_env. Pass
+            False for commands that are not the backend, such as the pip
+            that installs a built wheel.
+        """
         proc_env = os.environ.copy()
-        os.environ['PYTHON'] = sys.executable
-        if self._pythonpath is not self._sentinel:
+        proc_env['PYTHON'] = sys.executable
+        if use_build_env and self._pythonpath is not self._sentinel:
             if self._pythonpath is None:
                 proc_env.pop('PYTHONPATH', None)
             else:
                 proc_env['PYTHONPATH'] = self._pythonpath
+        if use_build_env and self._build_env is not None:
+            proc_env.update(self._build_env.environ())
+        profiler = _profiler()
+        if profiler is not None:
+            profiler.backend_environ(proc_env)
+        return proc_env
+
+    def _run_command(self, command, stdout=subprocess.PIPE, use_prefix=True,
+                     use_build_env=True):
+        cmd = self._command_line(command, use_prefix)
+        proc_env = self._command_env(use_build_env)
         try:
             sys.stderr.write("Running %s\n" % " ".join(cmd))
-            proc = subprocess.Popen(
-                cmd,
-                cwd=self.root, stdout=stdout,
-                stdin=subprocess.PIPE, env=proc_env)
+            out, used = usage.run(cmd, self.root, proc_env, stdout=stdout)
         except OSError as err:
             raise Exception("%r failed, %r" % (cmd, err))
-        out, _ = proc.communicate()
-        retcode = proc.poll()
-        if retcode:
-            raise Exception("%r failed, got %r" % (cmd, out))
+        _check_usage(cmd, out, used)
         return out
+
+
+def _remote_cache():
+    # Only pay for the HTTP client when a remote cache is configured.
+    if not os.environ.get('SETUPTOOLS_SHIM_REMOTE_CACHE'):
+        return None
+    from setuptools_shim import remote
+    return remote.RemoteCache.from_environ()
+
+
+# A plain wheel file name: no directory parts, nothing to escape a target.
+_WHEEL_NAME_RE = re.compile(r'^[A-Za-z0-9_.+-]+\.whl$')
+
+
+def _safe_wheel_name(name):
+    """Return True if name, from a remote cache, is safe to write."""
+    return bool(
+        name and os.path.basename(name) == name and
+        name not in ('.', '..') and _WHEEL_NAME_RE.match(name))
+
+
+def _check_usage(cmd, out, used):
+    if used.killed:
+        raise Exception(
+            "%r killed: exceeded %s limit (%s)" % (cmd, used.killed, used))
+    if used.returncode:
+        raise Exception("%r failed, got %r" % (cmd, out))
@@ -0,0 +1,114 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Warm the shim's caches for a set of source trees.
+
+Usage: python -m setuptools_shim.prefetch TREE [TREE ...]
+
+For each tree containing a pypa.json this builds wheels for the bootstrap
+and build requirements into the cache wheelhouse, and stores the backend
+metadata in the metadata cache. Later setup.py runs against the same trees
+are then served from the cache. They can still reach an index for anything
+missing; see "Caches" in doc/source/usage.rst for keeping them offline:
+PIP_NO_INDEX=1 only covers setuptools versions that install setup_requires
+with pip.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from setuptools_shim import cache
+from setuptools_shim.main import AbstractBuildSystem, _active_requirements
+
+
+def _pip(args):
+    command = [sys.executable, '-m', 'pip'] + args
+    sys.stderr.write("Running %s\n" % " ".join(command))
+    # pip's chatter goes to stderr, keeping stdout for the report.
+    subprocess.check_call(command, stdout=sys.stderr)
+
+
+def _fetch(requirements, wheelhouse, target, links=()):
+    """Build wheels for requirements and install them into target."""
+    if not requirements:
+        return
+    find_links = []
+    for link in [wheelhouse] + list(links):
+        find_links.extend(['--find-links', link])
+    _pip(['wheel', '-w', wheelhouse] + find_links + requirements)
+    _pip(['install', '--no-index', '--target', target] + find_links +
+         requirements)
+
+
+def prefetch(root, wheelhouse):
+    """Warm the caches for one source tree.
+
+    :return: A dict describing what was warmed.
+    """
+    build = AbstractBuildSystem(root)
+    target = tempfile.mkdtemp()
+    try:
+        bootstrap = list(build.bootstrap_requires)
+        _fetch(bootstrap, wheelhouse, target)
+        pythonpath = [target]
+        if os.environ.get('PYTHONPATH'):
+            pythonpath.append(os.environ['PYTHONPATH'])
+        build.force_pythonpath(os.pathsep.join(pythonpath))
+        requires, links = _active_requirements(build.build_requires())
+        _fetch(requires, wheelhouse, target, links)
+        # Populates the metadata cache as a side effect.
+        metadata = build.metadata()
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+    return {
+        'root': root,
+        'name': metadata.project_name,
+        'version': metadata.version,
+        'bootstrap_requires': bootstrap,
+        'build_requires': requires,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Warm the setuptools_shim caches for source trees.")
+    parser.add_argument('trees', nargs='+', metavar='TREE')
+    parser.add_argument(
+        '--no-shim', action='store_true',
+        help="Do not fetch setuptools_shim itself, e.g. when it is already "
+        "installed.")
+    args = parser.parse_args(argv)
+    wheelhouse = cache.wheelhouse()
+    cache.ensure_dir(wheelhouse)
+    if not args.no_shim:
+        _pip(['wheel', '-w', wheelhouse, '--find-links', wheelhouse,
+              'setuptools_shim'])
+    for tree in args.trees:
+        warmed = prefetch(os.path.abspath(tree), wheelhouse)
+        sys.stdout.write("%(name)s %(version)s (%(root)s)\n" % warmed)
+        for kind in 'bootstrap_requires', 'build_requires':
+            sys.stdout.write("  %s: %s\n" % (
+                kind, ", ".join(warmed[kind]) or "none"))
+    root = cache.cache_dir()
+    for name in sorted(os.listdir(root)):
+        files, size = cache.disk_usage(os.path.join(root, name))
+        sys.stdout.write("%s: %d files, %.1f MiB\n" % (
+            os.path.join(root, name), files, size / (1024.0 * 1024)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
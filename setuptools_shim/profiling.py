@@ -0,0 +1,213 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Profile the shim and the Python backends it runs.
+
+Set SETUPTOOLS_SHIM_PROFILE to a directory. Each shim invocation then
+creates ``<timestamp>-<pid>/`` in it and writes there:
+
+ - shim-<pid>-<n>-<phase>.prof: cProfile data for each phase of
+   setuptools_shim.main.main (config, build_env, then the command).
+ - backend-<pid>.prof: cProfile data for each Python process the shim
+   starts, written at exit by a sitecustomize hook placed first on the
+   backend's PYTHONPATH. Processes those start inherit the hook.
+
+Set SETUPTOOLS_SHIM_TRACEMALLOC to a frame count as well to also dump a
+tracemalloc snapshot (``.tracemalloc``, see tracemalloc.Snapshot.load) next
+to each profile.
+
+If SETUPTOOLS_SHIM_PROFILE_RUN is already set, e.g. by a wrapper script,
+that directory is used as is, so several invocations can share one.
+
+Usage: python -m setuptools_shim.profiling RUN_DIR [LIMIT]
+prints the combined statistics of every profile in RUN_DIR.
+"""
+
+import contextlib
+import itertools
+import os
+import sys
+import time
+
+
+# Written into the hook directory as sitecustomize.py. Stdlib only: it runs
+# before the backend's own requirements are importable.
+HOOK = '''\
+# Generated by setuptools_shim.profiling.
+import atexit
+import os
+import sys
+
+
+def _setuptools_shim_profile():
+    run_dir = os.environ.get('SETUPTOOLS_SHIM_PROFILE_RUN')
+    if not run_dir:
+        return
+    import cProfile
+    base = os.path.join(run_dir, 'backend-%d' % os.getpid())
+    snapshot = None
+    frames = os.environ.get('SETUPTOOLS_SHIM_TRACEMALLOC')
+    if frames:
+        try:
+            import tracemalloc
+            tracemalloc.start(int(frames))
+            snapshot = tracemalloc.take_snapshot
+        except ImportError:
+            pass
+    profiler = cProfile.Profile()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(base + '.prof')
+        if snapshot is not None:
+            snapshot().dump(base + '.tracemalloc')
+
+    atexit.register(dump)
+    profiler.enable()
+
+
+def _setuptools_shim_chain():
+    # Let any other sitecustomize on the path run too.
+    here = os.path.dirname(os.path.abspath(__file__))
+    saved = sys.path[:]
+    module = sys.modules.pop('sitecustomize', None)
+    sys.path[:] = [
+        p for p in sys.path if os.path.abspath(p or os.curdir) != here]
+    try:
+        import sitecustomize
+    except ImportError:
+        pass
+    finally:
+        sys.path[:] = saved
+        if module is not None:
+            sys.modules['sitecustomize'] = module
+
+
+_setuptools_shim_chain()
+_setuptools_shim_profile()
+'''
+
+
+class Profiler(object):
+    """Profiles for one shim invocation.
+
+    :attr run_dir: The directory all profiles are written to.
+    :attr frames: The tracemalloc frame count, or None.
+    """
+
+    def __init__(self, run_dir, frames=None):
+        from setuptools_shim import cache
+        self.run_dir = run_dir
+        self.frames = frames
+        self._counter = itertools.count()
+        cache.ensure_dir(run_dir)
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """Return a Profiler as configured, or None."""
+        if environ is None:
+            environ = os.environ
+        run_dir = environ.get('SETUPTOOLS_SHIM_PROFILE_RUN')
+        if not run_dir:
+            base = environ.get('SETUPTOOLS_SHIM_PROFILE')
+            if not base:
+                return None
+            run_dir = os.path.join(base, '%s-%d' % (
+                time.strftime('%Y%m%dT%H%M%S'), os.getpid()))
+        frames = environ.get('SETUPTOOLS_SHIM_TRACEMALLOC')
+        return cls(os.path.abspath(run_dir), int(frames) if frames else None)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Profile the body of the with statement as phase name."""
+        import cProfile
+        base = os.path.join(self.run_dir, 'shim-%d-%d-%s' % (
+            os.getpid(), next(self._counter), name))
+        tracemalloc = None
+        if self.frames:
+            try:
+                import tracemalloc
+            except ImportError:
+                pass
+            else:
+                tracemalloc.start(self.frames)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(base + '.prof')
+            if tracemalloc is not None:
+                tracemalloc.take_snapshot().dump(base + '.tracemalloc')
+                tracemalloc.stop()
+
+    def hook_dir(self):
+        """Return the directory holding the backend sitecustomize hook."""
+        path = os.path.join(self.run_dir, 'hook')
+        if not os.path.exists(os.path.join(path, 'sitecustomize.py')):
+            from setuptools_shim import cache
+            cache.ensure_dir(path)
+            cache.atomic_write(
+                os.path.join(path, 'sitecustomize.py'), HOOK.encode('ascii'))
+        return path
+
+    def backend_environ(self, proc_env):
+        """Update proc_env so a Python backend profiles itself."""
+        pythonpath = [self.hook_dir()]
+        if proc_env.get('PYTHONPATH'):
+            pythonpath.append(proc_env['PYTHONPATH'])
+        proc_env['PYTHONPATH'] = os.pathsep.join(pythonpath)
+        proc_env['SETUPTOOLS_SHIM_PROFILE_RUN'] = self.run_dir
+        if self.frames:
+            proc_env['SETUPTOOLS_SHIM_TRACEMALLOC'] = str(self.frames)
+
+
+_current = None
+
+
+def current():
+    """Return the process wide Profiler, or None if not profiling.
+
+    os.environ is left alone: processes join the run through
+    Profiler.backend_environ.
+    """
+    global _current
+    if _current is None:
+        _current = Profiler.from_environ()
+    return _current
+
+
+def main(argv=None):
+    import pstats
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or len(argv) > 2:
+        sys.stderr.write(
+            "Usage: python -m setuptools_shim.profiling RUN_DIR [LIMIT]\n")
+        return 2
+    run_dir = argv[0]
+    limit = int(argv[1]) if len(argv) > 1 else 30
+    names = sorted(
+        name for name in os.listdir(run_dir) if name.endswith('.prof'))
+    if not names:
+        sys.stderr.write("No profiles in %s\n" % (run_dir,))
+        return 1
+    stats = pstats.Stats(
+        *[os.path.join(run_dir, name) for name in names], stream=sys.stdout)
+    sys.stdout.write("%d profiles: %s\n" % (len(names), ", ".join(names)))
+    stats.sort_stats('cumulative').print_stats(limit)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
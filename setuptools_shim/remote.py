@@ -0,0 +1,188 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A shared cache tier behind the local caches.
+
+Set SETUPTOOLS_SHIM_REMOTE_CACHE to the URL of a cache server (e.g. one run
+with ``python -m setuptools_shim.cacheserver``) to share metadata and
+wheels between machines. SETUPTOOLS_SHIM_REMOTE_TIMEOUT sets the per
+request timeout in seconds (default 5). Entries are only stored when
+SETUPTOOLS_SHIM_REMOTE_TOKEN is set to the server's token; without it the
+remote cache is only read from.
+
+The protocol is plain HTTP/1.1, keyed exactly like the local caches:
+
+ - GET /<kind>/<key>: 200 with the entry, or 404.
+ - PUT /<kind>/<key>: store the body. Needs ``Authorization: Bearer
+   <token>``, else 403.
+
+Both directions carry the hex sha256 of the body in X-Shim-Sha256; the
+receiver checks it, and a GET without a matching hash is a miss.
+
+kind is 'metadata' or 'wheel'. Entries may carry a file name in X-Shim-Name
+(wheels need theirs). Any error or timeout disables the remote cache for
+the rest of the process and the shim carries on with local builds: a
+missing or slow server must never make a build fail or crawl.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urlsplit
+
+
+KINDS = ('metadata', 'wheel')
+
+
+class RemoteCache(object):
+    """Client for a remote cache server.
+
+    Connections are kept alive and re-used; at most max_connections
+    requests are in flight at once, across threads.
+
+    :attr url: The server URL.
+    :attr disabled: True once a request has failed.
+    """
+
+    def __init__(self, url, timeout=5.0, max_connections=4, token=None):
+        """Create a RemoteCache.
+
+        :param token: Sent with PUTs; without one, put() stores nothing.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported remote cache URL %r" % (url,))
+        self.url = url
+        self.disabled = False
+        self._https = parts.scheme == 'https'
+        self._netloc = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self._timeout = timeout
+        self._token = token
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """Return the configured RemoteCache, or None."""
+        if environ is None:
+            environ = os.environ
+        url = environ.get('SETUPTOOLS_SHIM_REMOTE_CACHE')
+        if not url:
+            return None
+        timeout = float(environ.get('SETUPTOOLS_SHIM_REMOTE_TIMEOUT', 5))
+        token = environ.get('SETUPTOOLS_SHIM_REMOTE_TOKEN') or None
+        config = (url, timeout, token)
+        with _instances_lock:
+            # One client per configuration, so connections are shared.
+            instance = _instances.get(config)
+            if instance is None:
+                instance = _instances[config] = cls(
+                    url, timeout, token=token)
+        return instance
+
+    def _connect(self):
+        """Return (connection, reused)."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        if self._https:
+            conn = httplib.HTTPSConnection(
+                self._netloc, timeout=self._timeout)
+        else:
+            conn = httplib.HTTPConnection(self._netloc, timeout=self._timeout)
+        return conn, False
+
+    def _request(self, method, kind, key, body=None, headers=None):
+        if kind not in KINDS:
+            raise ValueError("Unknown cache kind %r" % (kind,))
+        if self.disabled:
+            return None
+        path = '%s/%s/%s' % (self._prefix, kind, key)
+        with self._slots:
+            while True:
+                conn, reused = self._connect()
+                try:
+                    conn.request(method, path, body, headers or {})
+                    response = conn.getresponse()
+                    data = response.read()
+                    break
+                except Exception as e:
+                    conn.close()
+                    if reused:
+                        # The server may have closed an idle connection.
+                        continue
+                    self.disabled = True
+                    sys.stderr.write(
+                        "Remote cache %s unavailable, building locally: "
+                        "%s\n" % (self.url, e))
+                    return None
+            if response.getheader('connection', '').lower() == 'close':
+                conn.close()
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+        return (
+            response.status, response.getheader('x-shim-name'), data,
+            response.getheader('x-shim-sha256'))
+
+    def get(self, kind, key):
+        """Fetch an entry.
+
+        :return: (data, name) or None on a miss or error. name is None if
+            the entry has none.
+        """
+        result = self._request('GET', kind, key)
+        if result is None or result[0] != 200:
+            return None
+        status, name, data, sha256 = result
+        if sha256 != hashlib.sha256(data).hexdigest():
+            sys.stderr.write(
+                "Remote cache %s returned a corrupt %s/%s, ignoring it\n" % (
+                    self.url, kind, key))
+            return None
+        return data, name
+
+    def put(self, kind, key, data, name=None):
+        """Store an entry. Failures are logged, not raised.
+
+        :return: True if the server accepted the entry.
+        """
+        if not self._token:
+            return False
+        headers = {
+            'Authorization': 'Bearer ' + self._token,
+            'Content-Type': 'application/octet-stream',
+            'X-Shim-Sha256': hashlib.sha256(data).hexdigest(),
+            }
+        if name is not None:
+            headers['X-Shim-Name'] = name
+        result = self._request('PUT', kind, key, data, headers)
+        if result is None:
+            return False
+        if result[0] not in (200, 201, 204):
+            sys.stderr.write("Remote cache %s refused %s/%s: %d\n" % (
+                self.url, kind, key, result[0]))
+            return False
+        return True
+
+
+_instances = {}
+_instances_lock = threading.Lock()
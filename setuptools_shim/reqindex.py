@@ -0,0 +1,182 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Requirements parsed once, grouped by extra, with memoized markers.
+
+Packages with many extras and conditional requirements would otherwise be
+re-parsed and re-evaluated once per extra on every egg_info.
+"""
+
+import re
+
+from packaging.markers import default_environment
+from packaging.requirements import Requirement
+
+
+# Both spellings of an equality test against the extra marker variable.
+_EXTRA_RE = re.compile(
+    r'''\bextra\s*==\s*(['"])(.*?)\1|(['"])(.*?)\3\s*==\s*extra\b''')
+
+
+def canonical_extra(extra):
+    """Normalise an extra name for comparison (PEP 685)."""
+    return re.sub(r'[-_.]+', '-', extra).lower()
+
+
+def safe_extra(extra):
+    """Convert an extra name to the form setuptools uses."""
+    return re.sub('[^A-Za-z0-9.-]+', '_', extra).lower()
+
+
+def requirement_string(req):
+    """Format a packaging Requirement without its marker."""
+    extras = '[%s]' % ','.join(sorted(req.extras)) if req.extras else ''
+    if req.url:
+        return '%s%s @ %s' % (req.name, extras, req.url)
+    return '%s%s%s' % (req.name, extras, req.specifier)
+
+
+class MarkerEvaluator(object):
+    """Evaluate markers against one environment, at most once each."""
+
+    def __init__(self, environment=None):
+        """Create a MarkerEvaluator.
+
+        :param environment: Overrides for the default marker environment.
+        """
+        self._environment = default_environment()
+        if environment:
+            self._environment.update(environment)
+        self._results = {}
+
+    def evaluate(self, marker, extra=None, key=None):
+        """Evaluate marker with the extra variable set to extra.
+
+        :param extra: The extra being installed. None, as pkg_resources uses
+            for the base requirements, leaves the meaning of "extra == ''"
+            to the installed packaging: older releases treat it as false.
+        :param key: str(marker), if the caller already has it.
+        """
+        if marker is None:
+            return True
+        if key is None:
+            key = str(marker)
+        try:
+            return self._results[key, extra]
+        except KeyError:
+            pass
+        environment = dict(self._environment, extra=extra)
+        result = self._results[key, extra] = marker.evaluate(environment)
+        return result
+
+
+_default_evaluator = None
+
+
+def default_evaluator():
+    """Return a process wide MarkerEvaluator for the running Python."""
+    global _default_evaluator
+    if _default_evaluator is None:
+        _default_evaluator = MarkerEvaluator()
+    return _default_evaluator
+
+
+class RequirementIndex(object):
+    """Requirements grouped by the extras their markers mention.
+
+    :attr name: The project name, or None.
+    :attr version: The project version, or None.
+    :attr extras: The provided extras, in setuptools' safe form.
+    """
+
+    def __init__(self, requirements, extras=(), name=None, version=None):
+        """Create a RequirementIndex.
+
+        :param requirements: Requires-Dist strings.
+        :param extras: Provides-Extra names.
+        """
+        self.name = name
+        self.version = version
+        self.extras = []
+        self._display = {}
+        # Lists of (Requirement, marker key, extra to evaluate with).
+        self._base = []
+        self._by_extra = {}
+        for extra in extras:
+            self._add_extra(extra)
+        for line in requirements:
+            req = Requirement(line)
+            key = str(req.marker) if req.marker is not None else None
+            mentioned = []
+            if key is not None:
+                for match in _EXTRA_RE.finditer(key):
+                    mentioned.append(match.group(2) or match.group(4) or '')
+            # Even a marker that mentions extras may hold without one, as
+            # in "extra == 'x' or python_version >= '3'".
+            self._base.append((req, key, None))
+            for extra in mentioned:
+                canonical = canonical_extra(extra)
+                if not canonical:
+                    continue
+                self._add_extra(extra)
+                self._by_extra[canonical].append((req, key, extra))
+
+    def _add_extra(self, extra):
+        canonical = canonical_extra(extra)
+        if canonical and canonical not in self._display:
+            self._display[canonical] = safe_extra(extra)
+            self.extras.append(safe_extra(extra))
+            self._by_extra[canonical] = []
+
+    @classmethod
+    def from_metadata(cls, metadata_bytes):
+        """Build an index from METADATA / PKG-INFO content."""
+        import email.parser
+        if not isinstance(metadata_bytes, str):
+            metadata_bytes = metadata_bytes.decode('utf-8')
+        headers = email.parser.Parser().parsestr(
+            metadata_bytes, headersonly=True)
+        return cls(
+            headers.get_all('Requires-Dist') or [],
+            headers.get_all('Provides-Extra') or [],
+            name=headers.get('Name'), version=headers.get('Version'))
+
+    def resolve(self, evaluator=None):
+        """Select the requirements that apply in an environment.
+
+        :param evaluator: A MarkerEvaluator, defaulting to
+            default_evaluator().
+        :return: (base, extras): base is a list of requirement strings
+            (without markers); extras maps each extra to the strings it adds
+            beyond base.
+        """
+        if evaluator is None:
+            evaluator = default_evaluator()
+        base = []
+        seen = set()
+        for req, key, extra in self._base:
+            if evaluator.evaluate(req.marker, extra, key):
+                text = requirement_string(req)
+                if text not in seen:
+                    seen.add(text)
+                    base.append(text)
+        extras = {}
+        for canonical, entries in self._by_extra.items():
+            selected = extras[self._display[canonical]] = []
+            extra_seen = set(seen)
+            for req, key, extra in entries:
+                if evaluator.evaluate(req.marker, extra, key):
+                    text = requirement_string(req)
+                    if text not in extra_seen:
+                        extra_seen.add(text)
+                        selected.append(text)
+        return base, extras
@@ -3,14 +3,24 @@
 # interface that pip versions before support for pypa.json was added can still
 # install packages. To use, copy this file into a source tree as setup.py.
 
+import os
 import sys
 
-from setuptools import setup
-
 if __name__ == '__main__':
     orig_args = sys.argv
     sys_path = list(sys.path)
-    sys.argv = ['setup.py', 'test']
-    setup(name="stage1", setup_requires=["setuptools_shim"])
-    from setuptools_shim import main
+    try:
+        from setuptools_shim import main
+    except ImportError:
+        # Only pay for setuptools when setuptools_shim has to be fetched.
+        from setuptools import setup
+        sys.argv = ['setup.py', 'test']
+        # Use the setuptools_shim wheelhouse if one has been prefetched.
+        cache = os.environ.get('SETUPTOOLS_SHIM_CACHE_DIR') or os.path.join(
+            os.path.expanduser('~'), '.cache', 'setuptools_shim')
+        links = [os.path.join(cache, 'wheelhouse')]
+        links = [link for link in links if os.path.isdir(link)]
+        setup(name="stage1", setup_requires=["setuptools_shim"],
+              dependency_links=links)
+        from setuptools_shim import main
     sys.exit(main.main(orig_args, sys_path))
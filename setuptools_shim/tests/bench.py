@@ -0,0 +1,282 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""End to end benchmarks for the shim.
+
+Run with ``python -m setuptools_shim.tests.bench``. This reuses the
+functional test fixtures: a pip 7 virtualenv configured to install only
+from a local file:// repo, so the timed runs never touch the network
+(populating the repo does, exactly as for the functional tests).
+
+Each scenario is timed over several runs, both cold (fresh project tree,
+no .eggs, pip cache disabled) and warm (the same tree re-used). The time
+spent in each backend command is taken from the shim's usage records
+(see SETUPTOOLS_SHIM_USAGE_FILE); whatever is left over is reported as the
+'shim' phase.
+
+Results are written as JSON, and may be compared against a saved baseline:
+the process exits non-zero if any median regressed beyond the threshold.
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+
+import fixtures
+
+from setuptools_shim.tests.test_setuptools_shim import (
+    CapturedSubprocess,
+    SDistRepo,
+    TestProject,
+    Venv,
+    configure_mirror,
+    )
+from setuptools_shim.tests.scale import ScaleProject
+
+
+SCENARIOS = ['egg_info', 'develop', 'install', 'wheel']
+MODES = ['cold', 'warm']
+
+
+def _scenario_command(scenario, venv, project, scratch):
+    pip = [venv.python, '-m', 'pip']
+    if scenario == 'egg_info':
+        return [venv.python, 'setup.py', 'egg_info', '-e', scratch]
+    elif scenario == 'develop':
+        return pip + ['install', '-e', project.path]
+    elif scenario == 'install':
+        return pip + ['install', '--no-binary', ':all:', project.path]
+    elif scenario == 'wheel':
+        return pip + ['wheel', project.path, '-w', scratch]
+    raise ValueError("Unknown scenario %r" % (scenario,))
+
+
+def _undo(scenario, venv, project):
+    # develop only runs the backend's develop command, which installs
+    # nothing pip knows about, so there is nothing to undo.
+    if scenario == 'install':
+        name = getattr(project, 'name', 'test')
+        return [venv.python, '-m', 'pip', 'uninstall', '-y', name]
+    return None
+
+
+def phases(records, prefix_len, total):
+    """Break a run's time down by backend command.
+
+    :param records: The usage records (dicts) from one run.
+    :param prefix_len: The length of the project's build_command.
+    :param total: The total wall time of the run.
+    :return: A dict of phase name -> seconds, including 'shim' for the time
+        not spent in any backend command.
+    """
+    result = {}
+    for record in records:
+        command = record['command']
+        if command[1:3] == ['-m', 'pip']:
+            name = 'pip-install'
+        else:
+            name = command[prefix_len] if len(command) > prefix_len else ''
+        result[name] = result.get(name, 0.0) + record['wall']
+    result['shim'] = max(0.0, total - sum(result.values()))
+    return result
+
+
+def _read_usage(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rt') as source:
+        records = [json.loads(line) for line in source]
+    os.unlink(path)
+    return records
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def summarise(runs):
+    """Summarise a list of per-run phase dicts (including 'total')."""
+    names = set()
+    for run in runs:
+        names.update(run)
+    summary = {}
+    for name in sorted(names):
+        values = [run.get(name, 0.0) for run in runs]
+        summary[name] = {
+            'min': min(values),
+            'median': _median(values),
+            'mean': sum(values) / len(values),
+            }
+    return summary
+
+
+def compare(results, baseline, threshold):
+    """Find regressions between two result sets.
+
+    :param threshold: Permitted fractional slowdown of a median, e.g. 0.1.
+    :return: A list of (key, phase, baseline_median, median) tuples for
+        every phase whose median regressed beyond the threshold.
+    """
+    regressions = []
+    for key, summary in sorted(results['results'].items()):
+        base_summary = baseline['results'].get(key)
+        if base_summary is None:
+            continue
+        for phase, stats in sorted(summary.items()):
+            base = base_summary.get(phase)
+            if base is None:
+                continue
+            if stats['median'] > base['median'] * (1 + threshold):
+                regressions.append(
+                    (key, phase, base['median'], stats['median']))
+    return regressions
+
+
+class Bench(fixtures.Fixture):
+    """The environment benchmarks run in.
+
+    :attr venv: The Venv used for all runs.
+    :attr repo: The SDistRepo it installs from.
+    """
+
+    def _setUp(self):
+        self.venv = self.useFixture(Venv("bench"))
+        self.repo = self.useFixture(SDistRepo())
+        configure_mirror(self.repo, self.venv)
+        self.usage_path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'usage.json')
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_USAGE_FILE', self.usage_path))
+
+    def time_scenario(self, scenario, mode, runs, project_factory=TestProject):
+        """Time runs of scenario in mode.
+
+        :param project_factory: A fixture factory for the project to build.
+        :return: A list of phase dicts, one per run, each with a 'total'.
+            Warm mode does one extra, untimed, run first to fill caches.
+        """
+        results = []
+        if mode == 'warm':
+            runs += 1
+        with fixtures.TempDir() as scratch:
+            project = None
+            for run in range(runs):
+                if project is None or mode == 'cold':
+                    if project is not None:
+                        project.cleanUp()
+                    project = project_factory()
+                    project.setUp()
+                    # A shim cache of the bench's own: empty for each cold
+                    # run, shared by the warm ones.
+                    cache_dir = os.path.join(scratch.path, 'cache-%d' % run)
+                    os.mkdir(cache_dir)
+                command = _scenario_command(
+                    scenario, self.venv, project, scratch.path)
+                if mode == 'cold' and command[1:3] == ['-m', 'pip']:
+                    command.append('--no-cache-dir')
+                with open(os.path.join(project.path, 'pypa.json')) as f:
+                    prefix_len = len(json.load(f)['build_command'])
+                _read_usage(self.usage_path)
+                start = time.time()
+                with fixtures.EnvironmentVariable(
+                        'SETUPTOOLS_SHIM_CACHE_DIR', cache_dir):
+                    with CapturedSubprocess(
+                            '%s-%s-%d' % (scenario, mode, run), command,
+                            cwd=project.path):
+                        pass
+                total = time.time() - start
+                result = phases(
+                    _read_usage(self.usage_path), prefix_len, total)
+                result['total'] = total
+                results.append(result)
+                undo = _undo(scenario, self.venv, project)
+                if undo:
+                    with CapturedSubprocess('undo', undo):
+                        pass
+            project.cleanUp()
+        if mode == 'warm':
+            results = results[1:]
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        'scenarios', nargs='*', help="Default: %s." % ' '.join(SCENARIOS))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', action='append', choices=MODES)
+    parser.add_argument('--output', help="Write results JSON here.")
+    parser.add_argument('--baseline', help="Results JSON to compare with.")
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help="Permitted fractional slowdown of a median. Default 0.1.")
+    scale = parser.add_argument_group(
+        'scale', "Benchmark a synthetic ScaleProject instead of the "
+        "functional test project.")
+    scale.add_argument('--files', type=int)
+    scale.add_argument('--wheel-size', type=int)
+    scale.add_argument('--extras', type=int)
+    scale.add_argument('--requirements', type=int)
+    scale.add_argument('--build-requires', type=int)
+    scale.add_argument('--latency', type=float)
+    args = parser.parse_args(argv)
+    knobs = dict(
+        (action.dest, getattr(args, action.dest))
+        for action in scale._group_actions
+        if getattr(args, action.dest) is not None)
+    if knobs:
+        project_factory = functools.partial(ScaleProject, **knobs)
+    else:
+        project_factory = TestProject
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error("unknown scenario %r" % (scenario,))
+    args.scenarios = args.scenarios or SCENARIOS
+    results = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'scale': knobs,
+        'results': {},
+        }
+    with Bench() as bench:
+        for scenario in args.scenarios:
+            for mode in args.mode or MODES:
+                runs = bench.time_scenario(
+                    scenario, mode, args.runs, project_factory)
+                key = '%s/%s' % (scenario, mode)
+                results['results'][key] = summarise(runs)
+                sys.stdout.write("%-16s %.3fs median\n" % (
+                    key, results['results'][key]['total']['median']))
+    if args.output:
+        with open(args.output, 'wt') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, 'rt') as source:
+            baseline = json.load(source)
+        regressions = compare(results, baseline, args.threshold)
+        for key, phase, before, after in regressions:
+            sys.stdout.write("REGRESSION %s %s: %.3fs -> %.3fs\n" % (
+                key, phase, before, after))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Start-up cost benchmark for the shim's setup.py.
+
+Run with ``python -m setuptools_shim.tests.importtime``. pip runs setup.py
+several times per package, so what each run costs before the backend does
+any work is paid over and over. This runs ``setup.py COMMAND`` end to end
+in a ScaleProject, with setuptools_shim already importable, and reports the
+median wall time over several fresh interpreters along with how much of it
+the shim process spent importing (``-X importtime``, Python 3.7+).
+
+Results are written as JSON, and may be compared against a saved baseline:
+the process exits non-zero if any command regressed beyond the threshold.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import fixtures
+
+from setuptools_shim.tests.bench import _median
+from setuptools_shim.tests.scale import ScaleProject
+
+
+# setup.py commands to time; bdist_wheel gets -d added.
+COMMANDS = ['egg_info', 'bdist_wheel']
+
+# Modules that importing setuptools_shim.main must not pull in: each
+# command imports what it needs of these itself.
+HEAVY = [
+    'distutils', 'email.parser', 'glob', 'hashlib', 'http.client',
+    'packaging', 'pkg_resources', 'setuptools', 'setuptools_shim.fingerprint',
+    'setuptools_shim.frompip', 'setuptools_shim.remote', 'shutil',
+    'tempfile',
+    ]
+
+
+def loaded_modules(module):
+    """Return the modules a fresh interpreter has after importing module."""
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        'import json, sys; before = set(sys.modules); import %s; '
+        'print(json.dumps(sorted(set(sys.modules) - before)))' % module])
+    return json.loads(out.decode('utf-8'))
+
+
+def importtime(module):
+    """Return {module: cumulative microseconds} for importing module."""
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    if proc.returncode:
+        raise Exception("Importing %s failed: %s" % (module, err))
+    return _parse_importtime(err)[0]
+
+
+def setup_py(root, args, env=None):
+    """Run setup.py in root as pip would, with setuptools_shim importable.
+
+    :param args: The setup.py arguments, e.g. ['bdist_wheel', '-d', DIR].
+    :param env: The environment; defaults to os.environ.
+    :return: (seconds, {module: cumulative microseconds}, total import
+        microseconds). The import times are empty before Python 3.7.
+    """
+    env = dict(os.environ if env is None else env)
+    # As if setuptools_shim were installed, so setup.py skips its bootstrap.
+    here = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [here] + [p for p in [env.get('PYTHONPATH')] if p])
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', 'setup.py'] + list(args),
+        cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    seconds = time.time() - start
+    if proc.returncode:
+        raise Exception("setup.py %s failed: %s" % (
+            " ".join(args), (out + err).decode('utf-8', 'replace')))
+    times, total = _parse_importtime(err)
+    return seconds, times, total
+
+
+def _parse_importtime(err):
+    """Parse -X importtime output into (times, total microseconds)."""
+    times = {}
+    total = 0
+    for line in err.decode('utf-8', 'replace').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented below the one that caused them.
+        if not name[1:].startswith(' '):
+            total += int(cumulative)
+        times[name.strip()] = int(cumulative)
+    return times, total
+
+
+def time_command(command, runs):
+    """Return the median (milliseconds, import milliseconds) of command."""
+    with fixtures.TempDir() as tempdir:
+        cache_dir = os.path.join(tempdir.path, 'nocache')
+        env = dict(os.environ, SETUPTOOLS_SHIM_CACHE_DIR=cache_dir)
+        with ScaleProject() as project:
+            wall = []
+            imports = []
+            for run in range(runs):
+                args = [command]
+                if command == 'bdist_wheel':
+                    outputdir = os.path.join(tempdir.path, str(run))
+                    os.mkdir(outputdir)
+                    args.extend(['-d', outputdir])
+                seconds, _, total = setup_py(project.path, args, env)
+                wall.append(seconds * 1000)
+                imports.append(total / 1000.0)
+    return _median(wall), _median(imports)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('commands', nargs='*', metavar='COMMAND')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help="Write results JSON here.")
+    parser.add_argument('--baseline', help="Results JSON to compare with.")
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help="Permitted fractional slowdown. Default 0.2.")
+    args = parser.parse_args(argv)
+    results = {'python': sys.version.split()[0], 'results': {}}
+    for command in args.commands or COMMANDS:
+        wall, imports = time_command(command, args.runs)
+        results['results'][command] = wall
+        sys.stdout.write("setup.py %-16s %8.1fms median, %.1fms importing\n"
+                         % (command, wall, imports))
+    if args.output:
+        with open(args.output, 'wt') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, 'rt') as source:
+            baseline = json.load(source)['results']
+        regressed = False
+        for command, median in sorted(results['results'].items()):
+            if command in baseline and (
+                    median > baseline[command] * (1 + args.threshold)):
+                regressed = True
+                sys.stdout.write("REGRESSION %s: %.1fms -> %.1fms\n" % (
+                    command, baseline[command], median))
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
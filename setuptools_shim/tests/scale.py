@@ -0,0 +1,182 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Synthetic projects for stress testing the shim.
+
+ScaleProject writes a source tree whose build backend is a single
+self-contained script, scalebackend.py, driven by a scale.json written
+alongside it. The knobs control how big the backend's answers are, so that
+paths which scale badly with the number of files, extras or requirements
+show up in tests and benchmarks.
+"""
+
+import json
+import os
+from textwrap import dedent
+
+import fixtures
+
+from setuptools_shim.tests.test_setuptools_shim import mktree
+
+
+# A marker that is never true, used to keep requirements out of the way of
+# a real pip resolving the project.
+NEVER = 'platform_system == "ScaleNever"'
+
+
+BACKEND = dedent("""\
+    import base64
+    import hashlib
+    import json
+    import sys
+    import time
+    import zipfile
+
+    with open('scale.json', 'rt') as source:
+        config = json.load(source)
+    time.sleep(config['latency'])
+
+
+    def metadata():
+        lines = [
+            'Metadata-Version: 2.0',
+            'Name: scale',
+            'Version: 1.0',
+            ]
+        for extra in range(config['extras']):
+            lines.append('Provides-Extra: extra%d' % extra)
+        base_marker = ''
+        if config['resolvable']:
+            base_marker = config['never']
+        for req in range(config['requirements']):
+            # Spread requirements over the base set and each extra, and
+            # give every other one an environment marker.
+            slot = req % (config['extras'] + 1)
+            markers = []
+            if slot:
+                markers.append('extra == "extra%d"' % (slot - 1))
+            elif base_marker:
+                markers.append(base_marker)
+            if req % 2:
+                markers.append('python_version >= "2.6"')
+            line = 'Requires-Dist: req%d>=1.0' % req
+            if markers:
+                line += '; ' + ' and '.join(markers)
+            lines.append(line)
+        return '\\n'.join(lines) + '\\n'
+
+
+    def wheel(outputdir):
+        name = outputdir + '/scale-1.0-py2.py3-none-any.whl'
+        files = max(1, config['files'])
+        size = config['wheel_size'] // files
+        archive = zipfile.ZipFile(name, 'w')
+        record = []
+
+        def add(path, data):
+            archive.writestr(path, data)
+            digest = hashlib.sha256(data).digest()
+            record.append('%s,sha256=%s,%d' % (
+                path,
+                base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii'),
+                len(data)))
+        for index in range(files):
+            # Deterministic, incompressible-ish padding.
+            seed = hashlib.sha256(str(index).encode('ascii')).hexdigest()
+            padding = (seed * (size // len(seed) + 1))[:size]
+            add('scale/mod%d.py' % index,
+                ('# %s\\n' % padding).encode('ascii'))
+        add('scale-1.0.dist-info/METADATA', metadata().encode('utf-8'))
+        add('scale-1.0.dist-info/WHEEL', (
+            'Wheel-Version: 1.0\\n'
+            'Generator: scalebackend\\n'
+            'Root-Is-Purelib: true\\n'
+            'Tag: py2-none-any\\n'
+            'Tag: py3-none-any\\n').encode('ascii'))
+        record.append('scale-1.0.dist-info/RECORD,,')
+        archive.writestr(
+            'scale-1.0.dist-info/RECORD', '\\n'.join(record) + '\\n')
+        archive.close()
+
+
+    command = sys.argv[1:]
+    if command == ['metadata']:
+        sys.stdout.write(metadata())
+    elif command == ['build_requires']:
+        sys.stdout.write(json.dumps({'build_requires': [
+            'builddep%d; %s' % (index, config['never'])
+            for index in range(config['build_requires'])]}))
+    elif command[:1] == ['develop']:
+        with open('develop-done', 'wt'):
+            pass
+    elif command[:1] == ['wheel']:
+        if command[1:2] == ['-d']:
+            wheel(command[2])
+        else:
+            wheel('.')
+    else:
+        sys.exit(1)
+    """)
+
+
+class ScaleProject(fixtures.Fixture):
+    """A synthetic project with a configurable backend.
+
+    Build requirements always carry a never-true marker: they are evaluated
+    but never installed. With resolvable set, so do base requirements, and
+    the project can be installed by a real pip from a repo that lacks them;
+    extras are only resolved when asked for.
+
+    :attr path: The path to the project.
+    :attr name: The project name, as installed.
+    """
+
+    name = 'scale'
+
+    def __init__(self, files=1, wheel_size=0, extras=0, requirements=0,
+                 build_requires=0, latency=0.0, resolvable=True):
+        """Create a ScaleProject.
+
+        :param files: The number of files in the built wheel.
+        :param wheel_size: Approximate total size of those files, in bytes.
+        :param extras: The number of extras the project provides.
+        :param requirements: The number of Requires-Dist entries, spread
+            over the base requirements and the extras; every other one has
+            an environment marker as well.
+        :param build_requires: The number of build requirements.
+        :param latency: Seconds the backend sleeps on every invocation.
+        :param resolvable: Mark base requirements never-true (see above).
+        """
+        super(ScaleProject, self).__init__()
+        self.config = {
+            'files': files,
+            'wheel_size': wheel_size,
+            'extras': extras,
+            'requirements': requirements,
+            'build_requires': build_requires,
+            'latency': latency,
+            'resolvable': resolvable,
+            'never': NEVER,
+            }
+
+    def _setUp(self):
+        self.path = self.useFixture(fixtures.TempDir()).path
+        build_config = {'build_command': ["{PYTHON}", "scalebackend.py"]}
+        root = os.path.join(os.path.dirname(__file__), '../../')
+        with open(os.path.join(root, 'setuptools_shim/shim.py'), 'rt') as f:
+            setup_py = f.read()
+        mktree(self.path, [
+            ('pypa.json', json.dumps(build_config)),
+            ('scale.json', json.dumps(self.config)),
+            ('scalebackend.py', BACKEND),
+            ('setup.py', setup_py),
+            ])
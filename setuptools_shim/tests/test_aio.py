@@ -0,0 +1,106 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import sys
+from textwrap import dedent
+
+import fixtures
+from testtools import TestCase, skipIf
+
+from setuptools_shim.main import AbstractBuildSystem
+from setuptools_shim.tests.test_setuptools_shim import mktree
+
+
+BACKEND = dedent("""\
+    import json
+    import os
+    import sys
+    if sys.argv[1:] == ['metadata']:
+        sys.stdout.write('Metadata-Version: 2.0\\n'
+            'Name: %s\\nVersion: 1.0\\n' % os.path.basename(os.getcwd()))
+    elif sys.argv[1:] == ['build_requires']:
+        sys.stdout.write(json.dumps(
+            {'build_requires': [os.environ['PYTHON'] and 'dep']}))
+    else:
+        sys.exit(1)
+    """)
+
+
+def make_tree(path):
+    build_config = {'build_command': ["{PYTHON}", "backend.py"]}
+    mktree(path, [
+        ('pypa.json', json.dumps(build_config)),
+        ('backend.py', BACKEND),
+        ])
+    return AbstractBuildSystem(path)
+
+
+@skipIf(sys.version_info < (3, 7), "asyncio layer needs Python 3.7")
+class TestAsyncBuildSystem(TestCase):
+
+    def make_build(self, name):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path, name)
+        os.mkdir(path)
+        return make_tree(path)
+
+    def test_concurrent_metadata_and_build_requires(self):
+        from setuptools_shim import aio
+        builds = [self.make_build('proj%d' % i) for i in range(4)]
+        calls = []
+        for build in builds:
+            calls.append(aio.AsyncBuildSystem(build).metadata)
+            calls.append(aio.AsyncBuildSystem(build).build_requires)
+        results = aio.run(calls, limit=3)
+        names = [dist.project_name for dist in results[::2]]
+        self.assertEqual(['proj0', 'proj1', 'proj2', 'proj3'], names)
+        for reqs in results[1::2]:
+            self.assertEqual(['dep'], [str(r) for r in reqs])
+
+    def test_shares_metadata_cache(self):
+        from setuptools_shim import aio
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR',
+            self.useFixture(fixtures.TempDir()).path))
+        build = self.make_build('proj')
+        [dist] = aio.run([aio.AsyncBuildSystem(build).metadata])
+        self.assertEqual('proj', dist.project_name)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("backend run despite the cache")
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.main.AbstractBuildSystem._run_command', fail))
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.aio.AsyncBuildSystem._spawn', fail))
+        self.assertEqual('proj', build.metadata().project_name)
+        [dist] = aio.run([aio.AsyncBuildSystem(build).metadata])
+        self.assertEqual('proj', dist.project_name)
+
+    def test_failure_propagates(self):
+        from setuptools_shim import aio
+        build = self.make_build('proj')
+        calls = [lambda: aio.AsyncBuildSystem(build)._run_command(['bogus'])]
+        self.assertRaises(Exception, aio.run, calls)
+
+
+class TestCommandEnv(TestCase):
+
+    def test_does_not_mutate_os_environ(self):
+        self.useFixture(fixtures.EnvironmentVariable('PYTHON'))
+        path = self.useFixture(fixtures.TempDir()).path
+        build = make_tree(path)
+        build.force_pythonpath('/nonexistent')
+        env = build._command_env()
+        self.assertEqual(sys.executable, env['PYTHON'])
+        self.assertEqual('/nonexistent', env['PYTHONPATH'])
+        self.assertNotIn('PYTHON', os.environ)
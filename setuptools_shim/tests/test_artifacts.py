@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+import os
+
+import fixtures
+from packaging.requirements import Requirement
+from testtools import TestCase
+
+from setuptools_shim import artifacts
+from setuptools_shim.main import _active_requirements
+
+
+class TestArtifactVersion(TestCase):
+
+    def test_versions(self):
+        self.assertEqual('1.0', artifacts.artifact_version(
+            'tool-1.0-py2.py3-none-any.whl'))
+        self.assertEqual('2.0.post1', artifacts.artifact_version(
+            'my_tool-2.0.post1-1-cp36-cp36m-linux_x86_64.whl'))
+        self.assertEqual('0.3', artifacts.artifact_version(
+            'some-tool-0.3.tar.gz'))
+        self.assertEqual(None, artifacts.artifact_version('README'))
+
+
+class TestArtifactCache(TestCase):
+
+    def setUp(self):
+        super(TestArtifactCache, self).setUp()
+        self.source = self.useFixture(fixtures.TempDir()).path
+        self.cache = artifacts.ArtifactCache(
+            self.useFixture(fixtures.TempDir()).path)
+        self.wheel = os.path.join(
+            self.source, 'tool-1.0-py2.py3-none-any.whl')
+        with open(self.wheel, 'wb') as f:
+            f.write(b'not really a wheel')
+        self.sha256 = hashlib.sha256(b'not really a wheel').hexdigest()
+
+    def test_fetch_pinned(self):
+        url = 'file://%s#sha256=%s' % (self.wheel, self.sha256)
+        entry = self.cache.fetch(url)
+        self.assertEqual(
+            ['tool-1.0-py2.py3-none-any.whl'], os.listdir(entry))
+        os.unlink(self.wheel)
+        # Served from the cache without looking at the source again.
+        self.assertEqual(entry, self.cache.fetch(url))
+
+    def test_hash_mismatch(self):
+        url = 'file://%s#sha256=%s' % (self.wheel, '0' * 64)
+        e = self.assertRaises(Exception, self.cache.fetch, url)
+        self.assertIn('expected ' + '0' * 64, str(e))
+        self.assertEqual([], os.listdir(self.cache.path))
+
+    def test_hash_is_part_of_key(self):
+        unpinned = self.cache.fetch('file://%s' % self.wheel)
+        pinned = self.cache.fetch(
+            'file://%s#sha256=%s' % (self.wheel, self.sha256))
+        self.assertNotEqual(unpinned, pinned)
+
+    def test_hash_on_directory(self):
+        url = 'file://%s#sha256=%s' % (self.source, self.sha256)
+        self.assertRaises(Exception, self.cache.fetch, url)
+
+    def test_unsupported(self):
+        self.assertRaises(
+            Exception, self.cache.fetch, 'https://example.com/tool.exe')
+
+
+class TestActiveRequirements(TestCase):
+
+    def test_direct_reference(self):
+        cache_dir = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'cache')
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', cache_dir))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_WORK_DIR'))
+        source = self.useFixture(fixtures.TempDir()).path
+        wheel = os.path.join(source, 'tool-1.0-py2.py3-none-any.whl')
+        with open(wheel, 'wb') as f:
+            f.write(b'')
+        requires, links = _active_requirements([
+            Requirement('tool[x] @ file://%s' % wheel),
+            Requirement('other>=2'),
+            Requirement('never; python_version < "1"'),
+            ])
+        self.assertEqual(['tool[x]==1.0', 'other>=2'], requires)
+        self.assertEqual(1, len(links))
+        self.assertTrue(links[0].startswith(
+            os.path.join(cache_dir + '-work', 'artifacts')))
+        self.assertFalse(os.path.exists(cache_dir))
+        self.assertEqual(
+            ['tool-1.0-py2.py3-none-any.whl'], os.listdir(links[0]))
@@ -0,0 +1,137 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import sys
+
+import fixtures
+from testtools import TestCase
+
+from setuptools_shim import batch
+from setuptools_shim.main import _egg_info_install, _parse_wheel_name
+from setuptools_shim.tests.scale import ScaleProject
+
+
+class TestBatch(TestCase):
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR',
+            self.useFixture(fixtures.TempDir()).path))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_WORK_DIR',
+            self.useFixture(fixtures.TempDir()).path))
+        self.useFixture(fixtures.EnvironmentVariable('PIP_NO_INDEX', '1'))
+
+    def test_build_wheels(self):
+        projects = [
+            self.useFixture(ScaleProject(files=files)) for files in (1, 3)]
+        outputdir = self.useFixture(fixtures.TempDir()).path
+        wheels = batch.build_wheels(
+            [project.path for project in projects], outputdir, jobs=2)
+        self.assertEqual(
+            [os.path.join(outputdir, '0'), os.path.join(outputdir, '1')],
+            [os.path.dirname(wheel) for wheel in wheels])
+        self.assertEqual(
+            [('scale', 'scale-1.0')] * 2,
+            [_parse_wheel_name(wheel) for wheel in wheels])
+
+    def test_main_installs_once(self):
+        project = self.useFixture(ScaleProject())
+        target = self.useFixture(fixtures.TempDir()).path
+        out = self.useFixture(fixtures.StringStream('stdout'))
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', out.stream))
+        installs = []
+        real_install = batch.install
+
+        def install(wheels, no_deps, pip_options):
+            installs.append(len(wheels))
+            return real_install(wheels, no_deps, pip_options)
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.batch.install', install))
+        self.assertEqual(0, batch.main([
+            '--pip-option=--target=%s' % target, project.path]))
+        self.assertEqual([1], installs)
+        self.assertIn('scale-1.0.dist-info', os.listdir(target))
+        out.stream.flush()
+        self.assertEqual(
+            'scale-1.0 (%s)\n' % project.path,
+            out.getDetails()['stdout'].as_text())
+
+    def test_record_dir(self):
+        project = self.useFixture(ScaleProject())
+        target = self.useFixture(fixtures.TempDir()).path
+        record_dir = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'records')
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', sys.stdout))
+        self.assertEqual(0, batch.main([
+            '--record-dir', record_dir, '--pip-option=--target',
+            '--pip-option=%s' % target, project.path]))
+        with open(os.path.join(record_dir, 'scale-1.0-record.txt')) as f:
+            recorded = f.read().splitlines()
+        self.assertIn(os.path.join(target, 'scale', 'mod0.py'), recorded)
+        self.assertIn(
+            os.path.join(target, 'scale-1.0.dist-info', 'RECORD'), recorded)
+        # Left as pip installed it, so pip can uninstall it.
+        self.assertTrue(os.path.exists(
+            os.path.join(target, 'scale-1.0.dist-info', 'RECORD')))
+        self.assertNotIn('scale-1.0.egg-info', os.listdir(target))
+
+
+class TestLibDirs(TestCase):
+
+    def test_target(self):
+        self.assertEqual(['/t'], batch.lib_dirs('x', ['--target=/t']))
+        self.assertEqual(['/t'], batch.lib_dirs('x', ['-t', '/t']))
+        self.assertEqual(['/t'], batch.lib_dirs('x', ['-t/t', '--pre']))
+
+    def test_scheme_options(self):
+        calls = []
+
+        def distutils_scheme(name, **kwargs):
+            calls.append((name, kwargs))
+            return {'purelib': '/pure', 'platlib': '/plat'}
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.frompip.distutils_scheme', distutils_scheme))
+        self.assertEqual(['/pure', '/plat'], batch.lib_dirs(
+            'x', ['--no-index', '--root=/r', '--prefix', '/p']))
+        self.assertEqual(['/pure', '/plat'], batch.lib_dirs('x', ['--user']))
+        self.assertEqual([
+            ('x', {'user': False, 'root': '/r', 'prefix': '/p'}),
+            ('x', {'user': True, 'root': None, 'prefix': None}),
+            ], calls)
+
+
+class TestEggInfoInstall(TestCase):
+
+    def test_converts_record(self):
+        lib = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.frompip.distutils_scheme',
+            lambda name: {'purelib': lib, 'platlib': lib}))
+        os.mkdir(os.path.join(lib, 'scale-1.0.dist-info'))
+        with open(os.path.join(lib, 'scale-1.0.dist-info', 'RECORD'),
+                  'wt') as f:
+            f.write('scale.py,sha256=abc,10\n'
+                    'scale-1.0.dist-info/METADATA,sha256=def,20\n'
+                    'scale-1.0.dist-info/RECORD,,\n')
+        record = os.path.join(lib, 'record.txt')
+        _egg_info_install('scale', 'scale-1.0', record)
+        with open(record, 'rt') as f:
+            self.assertEqual([
+                os.path.join(lib, 'scale.py') + '\n',
+                os.path.join(lib, 'scale-1.0.egg-info/METADATA') + '\n',
+                os.path.join(lib, 'scale-1.0.egg-info/RECORD') + '\n',
+                ], f.readlines())
+        self.assertEqual(
+            ['record.txt', 'scale-1.0.egg-info'], sorted(os.listdir(lib)))
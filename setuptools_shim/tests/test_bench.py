@@ -0,0 +1,56 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from testtools import TestCase
+
+from setuptools_shim.tests import bench
+
+
+class TestAnalysis(TestCase):
+
+    def test_phases(self):
+        records = [
+            {'command': ['py', '-m', 'builder', 'metadata'], 'wall': 1.0},
+            {'command': ['py', '-m', 'builder', 'wheel', '-d', 'x'],
+             'wall': 2.0},
+            {'command': ['py', '-m', 'pip', '-v', 'install'], 'wall': 3.0},
+            ]
+        self.assertEqual(
+            {'metadata': 1.0, 'wheel': 2.0, 'pip-install': 3.0, 'shim': 4.0},
+            bench.phases(records, 3, 10.0))
+
+    def test_summarise(self):
+        summary = bench.summarise([{'total': 1.0}, {'total': 3.0}])
+        self.assertEqual(
+            {'total': {'min': 1.0, 'median': 2.0, 'mean': 2.0}}, summary)
+
+    def test_compare(self):
+        def results(median):
+            return {'results': {'install/cold': {
+                'total': {'median': median}}}}
+        self.assertEqual([], bench.compare(results(1.05), results(1.0), 0.1))
+        self.assertEqual(
+            [('install/cold', 'total', 1.0, 1.2)],
+            bench.compare(results(1.2), results(1.0), 0.1))
+
+    def test_undo(self):
+        class Venv(object):
+            python = 'py'
+
+        class Project(object):
+            name = 'scale'
+        self.assertEqual(
+            ['py', '-m', 'pip', 'uninstall', '-y', 'scale'],
+            bench._undo('install', Venv, Project))
+        # pip refuses to uninstall what develop never installed.
+        self.assertEqual(None, bench._undo('develop', Venv, Project))
+        self.assertEqual(None, bench._undo('wheel', Venv, Project))
@@ -0,0 +1,130 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import subprocess
+import sys
+
+import fixtures
+from testtools import TestCase
+
+from setuptools_shim import buildenv
+from setuptools_shim.main import AbstractBuildSystem, _new_pythonpath
+from setuptools_shim.tests.scale import ScaleProject
+
+
+class TestPaths(TestCase):
+
+    def test_dedupe_path(self):
+        self.assertEqual(
+            ['/a', '/b', 'c'],
+            buildenv.dedupe_path(['/a', '', '/b', '/a', '/b/', 'c', 'c']))
+
+    def test_new_pythonpath(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'PYTHONPATH', os.pathsep.join(['/x', '/y', '/x'])))
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.path', sys.path + ['/y', '/z', '/z']))
+        self.assertEqual(
+            os.pathsep.join(['/x', '/y', '/z']),
+            _new_pythonpath(sys.path[:-3]))
+
+    def test_isolated(self):
+        self.assertFalse(buildenv.isolated({}))
+        self.assertFalse(buildenv.isolated({'SETUPTOOLS_SHIM_ISOLATED': '0'}))
+        self.assertTrue(buildenv.isolated({'SETUPTOOLS_SHIM_ISOLATED': '1'}))
+
+
+class TestBuildEnv(TestCase):
+
+    def setUp(self):
+        super(TestBuildEnv, self).setUp()
+        # A cache that does not exist, so the caches stay off.
+        self.cache_dir = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'cache')
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', self.cache_dir))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_WORK_DIR'))
+
+    def test_empty(self):
+        env = buildenv.BuildEnv.create([])
+        self.assertTrue(env.path.startswith(
+            os.path.join(self.cache_dir + '-work', 'envs')))
+        self.assertFalse(os.path.exists(self.cache_dir))
+        self.useFixture(fixtures.EnvironmentVariable('PATH', '/usr/bin'))
+        self.assertEqual({
+            'PATH': os.pathsep.join(
+                [os.path.join(env.path, 'bin'), '/usr/bin']),
+            'PYTHONPATH': env.path,
+            'PYTHONNOUSERSITE': '1',
+            }, env.environ())
+
+    def test_scripts_on_path(self):
+        # pip install --target puts console scripts in bin/.
+        env = buildenv.BuildEnv.create([])
+        os.mkdir(os.path.join(env.path, 'bin'))
+        script = os.path.join(env.path, 'bin', 'python')
+        with open(script, 'wt') as output:
+            output.write('#!/bin/sh\necho from-env\n')
+        os.chmod(script, 0o755)
+        proc_env = dict(os.environ, **env.environ())
+        self.assertEqual(b'from-env\n', subprocess.check_output(
+            'python', shell=True, env=proc_env))
+
+    def test_pth_entries(self):
+        env = buildenv.BuildEnv.create([])
+        os.mkdir(os.path.join(env.path, 'extra'))
+        with open(os.path.join(env.path, 'x.pth'), 'wt') as pth:
+            pth.write('# comment\nextra\nmissing\nimport os\n')
+        self.assertEqual(
+            [os.path.join(env.path, 'extra')],
+            buildenv._pth_entries(env.path))
+
+    def test_installs_and_reuses(self):
+        project = self.useFixture(ScaleProject())
+        links = self.useFixture(fixtures.TempDir()).path
+        AbstractBuildSystem(project.path).wheel(links)
+        self.useFixture(fixtures.EnvironmentVariable('PIP_NO_INDEX', '1'))
+        env = buildenv.BuildEnv.create([project.name], [links])
+        self.assertTrue(any(
+            name.endswith('.dist-info') for name in os.listdir(env.path)))
+        self.assertEqual([env.path], env.pythonpath)
+        # A second create must not need pip or the links.
+        os.rename(links, links + '.gone')
+        self.addCleanup(os.rename, links + '.gone', links)
+        self.assertEqual(
+            env.path, buildenv.BuildEnv.create([project.name], [links]).path)
+
+    def test_backend_environment(self):
+        project = self.useFixture(ScaleProject())
+        build = AbstractBuildSystem(project.path)
+        build.force_pythonpath('/inherited')
+        build.use_build_env(buildenv.BuildEnv('/env', ['/env', '/env/x']))
+        proc_env = build._command_env()
+        self.assertEqual(
+            os.pathsep.join(['/env', '/env/x']), proc_env['PYTHONPATH'])
+        self.assertEqual('1', proc_env['PYTHONNOUSERSITE'])
+        self.assertEqual(
+            os.path.join('/env', 'bin'),
+            proc_env['PATH'].split(os.pathsep)[0])
+
+    def test_installer_environment(self):
+        self.useFixture(fixtures.EnvironmentVariable('PYTHONPATH', '/mine'))
+        self.useFixture(fixtures.EnvironmentVariable('PYTHONNOUSERSITE'))
+        project = self.useFixture(ScaleProject())
+        build = AbstractBuildSystem(project.path)
+        build.force_pythonpath('/inherited')
+        build.use_build_env(buildenv.BuildEnv('/env', ['/env', '/env/x']))
+        proc_env = build._command_env(use_build_env=False)
+        self.assertEqual('/mine', proc_env['PYTHONPATH'])
+        self.assertNotIn('PYTHONNOUSERSITE', proc_env)
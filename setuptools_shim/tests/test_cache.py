@@ -0,0 +1,121 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import errno
+import os
+import stat
+import sys
+
+import fixtures
+from testtools import TestCase
+
+from setuptools_shim import cache
+from setuptools_shim import prefetch
+from setuptools_shim.main import AbstractBuildSystem
+from setuptools_shim.tests.scale import ScaleProject
+
+
+class TestKeys(TestCase):
+
+    def test_metadata_key_varies_with_interpreter_not_platform(self):
+        key = cache.metadata_key('tree')
+        self.assertNotEqual('tree', key)
+        self.assertNotEqual(key, cache.metadata_key('other'))
+        self.assertNotEqual(key, cache.wheel_key('tree'))
+        self.useFixture(fixtures.MonkeyPatch(
+            'sysconfig.get_platform', lambda: 'elsewhere'))
+        self.assertEqual(key, cache.metadata_key('tree'))
+        self.useFixture(fixtures.MonkeyPatch(
+            'platform.python_implementation', lambda: 'OtherPython'))
+        self.assertNotEqual(key, cache.metadata_key('tree'))
+        self.useFixture(fixtures.MonkeyPatch(
+            'sys.version_info', (sys.version_info[0], 99, 0)))
+        self.assertNotEqual(key, cache.metadata_key('tree'))
+
+    def test_wheel_key_varies_with_platform(self):
+        key = cache.wheel_key('tree')
+        self.useFixture(fixtures.MonkeyPatch(
+            'sysconfig.get_platform', lambda: 'elsewhere'))
+        self.assertNotEqual(key, cache.wheel_key('tree'))
+
+
+class TestMetadataCache(TestCase):
+
+    def setUp(self):
+        super(TestMetadataCache, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch('sys.stderr', sys.stderr))
+        self.cache_dir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', self.cache_dir))
+
+    def test_unused_until_created(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', self.cache_dir + '/missing'))
+        self.assertEqual(None, cache.MetadataCache.from_environ())
+        self.assertEqual([], cache.dependency_links())
+
+    def test_work_dir(self):
+        self.assertEqual(
+            '/c-work', cache.work_dir({'SETUPTOOLS_SHIM_CACHE_DIR': '/c/'}))
+        self.assertEqual('/w', cache.work_dir({
+            'SETUPTOOLS_SHIM_CACHE_DIR': '/c',
+            'SETUPTOOLS_SHIM_WORK_DIR': '/w'}))
+
+    def test_metadata_served_from_cache(self):
+        project = self.useFixture(ScaleProject(extras=2, requirements=6))
+        build = AbstractBuildSystem(project.path)
+        first = build.metadata()
+        calls = []
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.main.AbstractBuildSystem._run_command',
+            lambda *args, **kwargs: calls.append(args)))
+        second = build.metadata()
+        self.assertEqual([], calls)
+        self.assertEqual(first.extras, second.extras)
+
+    def test_unreadable_wheel_is_a_miss(self):
+        project = self.useFixture(ScaleProject())
+        build = AbstractBuildSystem(project.path)
+        outputdir = self.useFixture(fixtures.TempDir()).path
+        os.unlink(build.wheel(outputdir))
+
+        def copyfile(source, target):
+            # As for an entry written by another user.
+            raise IOError(errno.EACCES, "Permission denied", source)
+        self.useFixture(fixtures.MonkeyPatch('shutil.copyfile', copyfile))
+        self.assertTrue(os.path.exists(build.wheel(outputdir)))
+
+    def test_prefetch(self):
+        project = self.useFixture(ScaleProject(build_requires=3))
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', sys.stdout))
+        self.assertEqual(
+            0, prefetch.main(['--no-shim', project.path]))
+        key = cache.metadata_key(
+            AbstractBuildSystem(project.path).fingerprint())
+        metadata_cache = cache.MetadataCache.from_environ()
+        self.assertIn(b'Name: scale', metadata_cache.get(key))
+        self.assertEqual([self.cache_dir + '/wheelhouse'],
+                         cache.dependency_links())
+
+
+class TestAtomicWrite(TestCase):
+
+    def test_mode_follows_umask(self):
+        path = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.cache._cached_umask', None))
+        old = os.umask(0o027)
+        self.addCleanup(os.umask, old)
+        cache.atomic_write(os.path.join(path, 'entry'), b'data')
+        self.assertEqual(
+            0o640, stat.S_IMODE(os.stat(os.path.join(path, 'entry')).st_mode))
+        self.assertEqual(['entry'], os.listdir(path))
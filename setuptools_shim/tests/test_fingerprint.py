@@ -0,0 +1,164 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import subprocess
+
+import fixtures
+from testtools import TestCase
+
+from setuptools_shim import fingerprint
+from setuptools_shim.tests.test_setuptools_shim import mktree
+
+
+class TestFingerprint(TestCase):
+
+    def setUp(self):
+        super(TestFingerprint, self).setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        mktree(self.root, [
+            'pkg', ('pkg/a.py', 'a'), ('pkg/b.py', 'b'), ('pypa.json', '{}'),
+            '.eggs', ('.eggs/junk', 'junk'),
+            ])
+        # Pretend everything is old enough not to be racily clean.
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.fingerprint.RACY_NS', -10 ** 12))
+
+    def test_unchanged_tree_is_not_rehashed(self):
+        first = fingerprint.Fingerprint(self.root)
+        digest = first.digest()
+        self.assertEqual(
+            ['pkg/a.py', 'pkg/b.py', 'pypa.json'], sorted(first.rehashed))
+        second = fingerprint.Fingerprint(self.root)
+        self.assertEqual(digest, second.digest())
+        self.assertEqual([], second.rehashed)
+
+    def test_only_changed_files_rehashed(self):
+        digest = fingerprint.Fingerprint(self.root).digest()
+        with open(os.path.join(self.root, 'pkg/a.py'), 'wt') as f:
+            f.write('changed')
+        print_ = fingerprint.Fingerprint(self.root)
+        self.assertNotEqual(digest, print_.digest())
+        self.assertEqual(['pkg/a.py'], print_.rehashed)
+
+    def test_deletion_changes_digest(self):
+        digest = fingerprint.Fingerprint(self.root).digest()
+        os.unlink(os.path.join(self.root, 'pkg/b.py'))
+        self.assertNotEqual(
+            digest, fingerprint.Fingerprint(self.root).digest())
+
+    def test_ignored_and_index_do_not_count(self):
+        digest = fingerprint.Fingerprint(self.root).digest()
+        with open(os.path.join(self.root, '.eggs/more'), 'wt') as f:
+            f.write('more')
+        os.mkdir(os.path.join(self.root, 'build'))
+        self.assertEqual(digest, fingerprint.Fingerprint(self.root).digest())
+        self.assertTrue(os.path.exists(
+            os.path.join(self.root, fingerprint.INDEX_NAME)))
+
+    def test_index_temp_files_do_not_count(self):
+        digest = fingerprint.Fingerprint(self.root).digest()
+        # Left behind by a crashed index write.
+        with open(os.path.join(
+                self.root, fingerprint.INDEX_NAME + '.abc123'), 'wb') as f:
+            f.write(b'partial')
+        self.assertEqual(digest, fingerprint.Fingerprint(self.root).digest())
+
+    def test_files_deleted_during_digest_are_skipped(self):
+        digest = fingerprint.Fingerprint(self.root).digest()
+        os.unlink(os.path.join(self.root, fingerprint.INDEX_NAME))
+
+        def walker(real):
+            def walk(root, relroot, ignore, nested, result):
+                real(root, relroot, ignore, nested, result)
+                if not relroot:
+                    # Listed, then gone before it was read.
+                    result['vanished'] = (1, 0, 0)
+            return walk
+        for name in '_walk_scandir', '_walk_listdir':
+            self.useFixture(fixtures.MonkeyPatch(
+                'setuptools_shim.fingerprint.' + name,
+                walker(getattr(fingerprint, name))))
+        self.assertEqual(digest, fingerprint.Fingerprint(self.root).digest())
+
+    def test_nested_build_dirs_count(self):
+        mktree(self.root, [
+            'src', 'src/pkg', 'src/pkg/build', 'src/pkg/dist',
+            ('src/pkg/build/__init__.py', ''),
+            ('src/pkg/dist/data.whl', 'data'),
+            ])
+        digest = fingerprint.Fingerprint(self.root).digest()
+        with open(os.path.join(self.root, 'src/pkg/build/__init__.py'),
+                  'wt') as f:
+            f.write('changed')
+        print_ = fingerprint.Fingerprint(self.root)
+        self.assertNotEqual(digest, print_.digest())
+        self.assertEqual(['src/pkg/build/__init__.py'], print_.rehashed)
+
+    def test_stable_across_indexes(self):
+        digest = fingerprint.Fingerprint(self.root).digest()
+        os.unlink(os.path.join(self.root, fingerprint.INDEX_NAME))
+        self.assertEqual(digest, fingerprint.Fingerprint(self.root).digest())
+
+    def test_racily_clean_files_rehashed(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.fingerprint.RACY_NS', 10 ** 12))
+        fingerprint.Fingerprint(self.root).digest()
+        second = fingerprint.Fingerprint(self.root)
+        second.digest()
+        self.assertEqual(3, len(second.rehashed))
+
+
+class TestVcsState(TestCase):
+
+    def setUp(self):
+        super(TestVcsState, self).setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        mktree(self.root, ['pkg', ('pkg/a.py', 'a')])
+        for name in ('GIT_DIR', 'GIT_WORK_TREE', 'GIT_INDEX_FILE'):
+            self.useFixture(fixtures.EnvironmentVariable(name))
+        for var in ('AUTHOR', 'COMMITTER'):
+            self.useFixture(fixtures.EnvironmentVariable(
+                'GIT_%s_NAME' % var, 'Test'))
+            self.useFixture(fixtures.EnvironmentVariable(
+                'GIT_%s_EMAIL' % var, 'test@example.com'))
+        try:
+            self.git('init', '-q')
+        except OSError:
+            self.skipTest("git is not installed")
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', 'initial')
+
+    def git(self, *args):
+        subprocess.check_call(('git',) + args, cwd=self.root)
+
+    def test_outside_a_checkout(self):
+        self.assertEqual('', fingerprint.vcs_state(
+            self.useFixture(fixtures.TempDir()).path))
+
+    def test_tags_and_commits_change_digest(self):
+        # Say, pbr: the version comes from the tags, not from any file.
+        digests = [fingerprint.Fingerprint(self.root).digest()]
+        self.git('tag', '1.0')
+        digests.append(fingerprint.Fingerprint(self.root).digest())
+        self.git('commit', '-q', '--allow-empty', '-m', 'empty')
+        digests.append(fingerprint.Fingerprint(self.root).digest())
+        self.git('pack-refs', '--all')
+        digests.append(fingerprint.Fingerprint(self.root).digest())
+        self.assertEqual(3, len(set(digests)))
+        self.assertEqual(digests[2], digests[3])
+
+    def test_subdirectory(self):
+        state = fingerprint.vcs_state(os.path.join(self.root, 'pkg'))
+        self.assertEqual(state, fingerprint.vcs_state(self.root))
+        self.assertTrue(state.startswith('HEAD '))
+        self.assertTrue(len(state) > len('HEAD '))
@@ -0,0 +1,62 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import sys
+
+import fixtures
+from testtools import TestCase, skipIf
+
+from setuptools_shim.tests import importtime
+from setuptools_shim.tests.scale import ScaleProject
+
+
+class TestImports(TestCase):
+
+    def test_main_imports_nothing_heavy(self):
+        loaded = importtime.loaded_modules('setuptools_shim.main')
+        heavy = [
+            name for name in loaded
+            for prefix in importtime.HEAVY
+            if name == prefix or name.startswith(prefix + '.')]
+        self.assertEqual([], heavy)
+
+
+@skipIf(sys.version_info < (3, 7), "-X importtime needs Python 3.7")
+class TestSetupPy(TestCase):
+
+    def setUp(self):
+        super(TestSetupPy, self).setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.env = dict(
+            os.environ,
+            SETUPTOOLS_SHIM_CACHE_DIR=os.path.join(self.tempdir, 'nocache'))
+        self.env.pop('SETUPTOOLS_SHIM_ISOLATED', None)
+        self.project = self.useFixture(ScaleProject(build_requires=2))
+
+    def test_bdist_wheel_skips_setuptools(self):
+        # Nothing to install, so nothing needs setuptools or pkg_resources.
+        seconds, times, total = importtime.setup_py(
+            self.project.path, ['bdist_wheel', '-d', self.tempdir], self.env)
+        self.assertIn('setuptools_shim.main', times)
+        self.assertEqual(
+            [], [name for name in ('setuptools', 'pkg_resources', 'distutils')
+                 if name in times])
+        self.assertIn(
+            'scale-1.0-py2.py3-none-any.whl', os.listdir(self.tempdir))
+        self.assertTrue(0 < total < seconds * 10 ** 6)
+
+    def test_egg_info(self):
+        _, times, _ = importtime.setup_py(
+            self.project.path, ['egg_info'], self.env)
+        self.assertIn('setuptools_shim.main', times)
+        self.assertIn('setuptools', times)
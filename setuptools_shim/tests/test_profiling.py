@@ -0,0 +1,118 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import pstats
+import subprocess
+import sys
+
+import fixtures
+from testtools import TestCase, skipIf
+
+from setuptools_shim import profiling
+from setuptools_shim.main import AbstractBuildSystem, _phase
+from setuptools_shim.tests.scale import ScaleProject
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        super(TestProfiler, self).setUp()
+        self.base = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.profiling._current', None))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_PROFILE', self.base))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_PROFILE_RUN'))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_TRACEMALLOC'))
+
+    def test_from_environ(self):
+        self.assertEqual(None, profiling.Profiler.from_environ({}))
+        profiler = profiling.Profiler.from_environ(
+            {'SETUPTOOLS_SHIM_PROFILE': self.base})
+        self.assertEqual(self.base, os.path.dirname(profiler.run_dir))
+        self.assertTrue(profiler.run_dir.endswith('-%d' % os.getpid()))
+        run_dir = os.path.join(self.base, 'shared')
+        profiler = profiling.Profiler.from_environ({
+            'SETUPTOOLS_SHIM_PROFILE': self.base,
+            'SETUPTOOLS_SHIM_PROFILE_RUN': run_dir,
+            'SETUPTOOLS_SHIM_TRACEMALLOC': '5',
+            })
+        self.assertEqual((run_dir, 5), (profiler.run_dir, profiler.frames))
+
+    def test_phases(self):
+        with _phase('config'):
+            pass
+        with _phase('bdist_wheel'):
+            sum(range(1000))
+        run_dir = profiling.current().run_dir
+        self.assertEqual(self.base, os.path.dirname(run_dir))
+        self.assertNotIn('SETUPTOOLS_SHIM_PROFILE_RUN', os.environ)
+        pid = os.getpid()
+        self.assertEqual(
+            ['shim-%d-0-config.prof' % pid,
+             'shim-%d-1-bdist_wheel.prof' % pid],
+            sorted(os.listdir(run_dir)))
+        stats = pstats.Stats(
+            os.path.join(run_dir, 'shim-%d-1-bdist_wheel.prof' % pid))
+        self.assertTrue(stats.total_calls)
+
+    @skipIf(sys.version_info < (3, 4), "tracemalloc needs Python 3.4")
+    def test_tracemalloc(self):
+        import tracemalloc
+        profiler = profiling.Profiler(
+            os.path.join(self.base, 'run'), frames=3)
+        with profiler.phase('config'):
+            [str(i) for i in range(100)]
+        snapshot = tracemalloc.Snapshot.load(os.path.join(
+            profiler.run_dir, 'shim-%d-0-config.tracemalloc' % os.getpid()))
+        self.assertEqual(3, snapshot.traceback_limit)
+
+    def test_backend_hook(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', os.path.join(self.base, 'nocache')))
+        project = self.useFixture(ScaleProject())
+        AbstractBuildSystem(project.path).metadata()
+        run_dir = profiling.current().run_dir
+        backends = [
+            name for name in os.listdir(run_dir)
+            if name.startswith('backend-') and name.endswith('.prof')]
+        self.assertEqual(1, len(backends))
+        stats = pstats.Stats(os.path.join(run_dir, backends[0]))
+        self.assertTrue(stats.total_calls)
+
+    def test_hook_chains_sitecustomize(self):
+        other = self.useFixture(fixtures.TempDir()).path
+        with open(os.path.join(other, 'sitecustomize.py'), 'wt') as f:
+            f.write('import os\nos.environ["CHAINED"] = "yes"\n')
+        profiler = profiling.Profiler(os.path.join(self.base, 'run'))
+        env = dict(os.environ, PYTHONPATH=other)
+        profiler.backend_environ(env)
+        out = subprocess.check_output(
+            [sys.executable, '-c',
+             'import os; print(os.environ.get("CHAINED"))'], env=env)
+        self.assertEqual(b'yes', out.strip())
+        self.assertEqual(1, len([
+            name for name in os.listdir(profiler.run_dir)
+            if name.startswith('backend-')]))
+
+    def test_main(self):
+        profiler = profiling.Profiler(os.path.join(self.base, 'run'))
+        with profiler.phase('config'):
+            pass
+        out = self.useFixture(fixtures.StringStream('stdout'))
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', out.stream))
+        self.assertEqual(0, profiling.main([profiler.run_dir, '5']))
+        out.stream.flush()
+        self.assertIn('1 profiles', out.getDetails()['stdout'].as_text())
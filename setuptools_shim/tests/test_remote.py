@@ -0,0 +1,161 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+import os
+import socket
+import sys
+import threading
+
+import fixtures
+from testtools import TestCase
+
+from setuptools_shim import remote
+from setuptools_shim.cacheserver import CacheServer
+from setuptools_shim.main import AbstractBuildSystem
+from setuptools_shim.tests.scale import ScaleProject
+
+
+KEY = 'a' * 64
+TOKEN = 'sekrit'
+
+
+class CacheServerFixture(fixtures.Fixture):
+    """A CacheServer running in a thread.
+
+    :attr url: The server URL.
+    """
+
+    def _setUp(self):
+        root = self.useFixture(fixtures.TempDir()).path
+        self.server = CacheServer(root, token=TOKEN)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = self.server.url
+
+
+class TestRemoteCache(TestCase):
+
+    def setUp(self):
+        super(TestRemoteCache, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch('sys.stderr', sys.stderr))
+        self.server = self.useFixture(CacheServerFixture())
+
+    def test_round_trip_reuses_connection(self):
+        client = remote.RemoteCache(self.server.url, token=TOKEN)
+        self.assertEqual(None, client.get('wheel', KEY))
+        self.assertTrue(
+            client.put('wheel', KEY, b'data', 'x-1.0-py2-none-any.whl'))
+        self.assertEqual(
+            (b'data', 'x-1.0-py2-none-any.whl'), client.get('wheel', KEY))
+        self.assertEqual(1, len(client._idle))
+
+    def test_rejects_bad_hash(self):
+        client = remote.RemoteCache(self.server.url, token=TOKEN)
+        result = client._request(
+            'PUT', 'metadata', KEY, b'data', {
+                'X-Shim-Sha256': 'bogus',
+                'Authorization': 'Bearer ' + TOKEN})
+        self.assertEqual(400, result[0])
+        self.assertEqual(None, client.get('metadata', KEY))
+
+    def test_put_needs_token(self):
+        for token in (None, 'wrong'):
+            client = remote.RemoteCache(self.server.url, token=token)
+            self.assertFalse(client.put('metadata', KEY, b'data'))
+        self.assertEqual(
+            403, client._request('PUT', 'metadata', KEY, b'data', {
+                'X-Shim-Sha256': hashlib.sha256(b'data').hexdigest()})[0])
+        self.assertEqual(None, client.get('metadata', KEY))
+
+    def test_server_without_token_is_read_only(self):
+        self.server.server.token = None
+        client = remote.RemoteCache(self.server.url, token=TOKEN)
+        self.assertFalse(client.put('metadata', KEY, b'data'))
+        self.assertEqual(None, client.get('metadata', KEY))
+
+    def test_unavailable_server_disables(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        client = remote.RemoteCache('http://127.0.0.1:%d' % port)
+        self.assertEqual(None, client.get('metadata', KEY))
+        self.assertTrue(client.disabled)
+        self.assertFalse(client.put('metadata', KEY, b'data'))
+
+    def test_slow_server_disables(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(1)
+        self.addCleanup(sock.close)
+        client = remote.RemoteCache(
+            'http://127.0.0.1:%d' % sock.getsockname()[1], timeout=0.2)
+        self.assertEqual(None, client.get('metadata', KEY))
+        self.assertTrue(client.disabled)
+
+    def test_builds_share_wheels_and_metadata(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_REMOTE_CACHE', self.server.url))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_REMOTE_TOKEN', TOKEN))
+        project = self.useFixture(ScaleProject(files=3))
+        outputdir = self.useFixture(fixtures.TempDir()).path
+        build = AbstractBuildSystem(project.path)
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', outputdir + '/missing'))
+        build.metadata()
+        built = build.wheel(outputdir)
+        os.unlink(built)
+        # A second builder, with a fresh local cache, never runs the backend.
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR',
+            self.useFixture(fixtures.TempDir()).path))
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.main.AbstractBuildSystem._run_command',
+            lambda *args, **kwargs: self.fail("backend run")))
+        self.assertEqual('scale', build.metadata().project_name)
+        self.assertEqual(built, build.wheel(outputdir))
+        self.assertTrue(os.path.exists(built))
+
+    def test_corrupt_entry_is_a_miss(self):
+        client = remote.RemoteCache(self.server.url, token=TOKEN)
+        self.assertTrue(client.put('metadata', KEY, b'data'))
+        with open(os.path.join(
+                self.server.server.root, 'metadata', KEY[:2], KEY), 'wb') as f:
+            f.write(b'damaged')
+        self.assertEqual(None, client.get('metadata', KEY))
+
+    def test_unsafe_wheel_name_is_a_miss(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_REMOTE_CACHE', self.server.url))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_REMOTE_TOKEN', TOKEN))
+        project = self.useFixture(ScaleProject())
+        build = AbstractBuildSystem(project.path)
+        outputdir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', outputdir + '/missing'))
+        for name in ('../escaped.whl', '/tmp/abs.whl', 'notawheel'):
+            self.useFixture(fixtures.MonkeyPatch(
+                'setuptools_shim.remote.RemoteCache.get',
+                lambda self, kind, key: (b'evil', name)))
+            built = build.wheel(outputdir)
+            self.assertEqual(outputdir, os.path.dirname(built))
+            with open(built, 'rb') as f:
+                self.assertNotEqual(b'evil', f.read())
+            os.unlink(built)
+        self.assertFalse(os.path.exists(
+            os.path.join(os.path.dirname(outputdir), 'escaped.whl')))
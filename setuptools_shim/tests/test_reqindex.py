@@ -0,0 +1,87 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sys
+from textwrap import dedent
+
+import fixtures
+from testtools import TestCase
+
+from setuptools_shim import reqindex
+from setuptools_shim.main import AbstractBuildSystem
+from setuptools_shim.tests.scale import ScaleProject
+
+
+METADATA = dedent("""\
+    Metadata-Version: 2.0
+    Name: test
+    Version: 1.0.0
+    Provides-Extra: extra
+    Provides-Extra: Other_Thing
+    Requires-Dist: extra; extra == 'extra'
+    Requires-Dist: nothing; extra == ''
+    Requires-Dist: testdep
+    Requires-Dist: testdep; extra == 'extra'
+    Requires-Dist: never; python_version < '1'
+    Requires-Dist: both[x]>=1; extra == "extra" or extra == "other-thing"
+    Requires-Dist: missing; extra == "absent" and python_version < "1"
+    Requires-Dist: either; extra == "extra" or python_version >= "1"
+    Requires-Dist: neither; extra == "extra" or python_version < "1"
+    """).encode('utf-8')
+
+
+class TestRequirementIndex(TestCase):
+
+    def test_resolve(self):
+        index = reqindex.RequirementIndex.from_metadata(METADATA)
+        self.assertEqual(('test', '1.0.0'), (index.name, index.version))
+        self.assertEqual(['extra', 'other_thing', 'absent'], index.extras)
+        base, extras = index.resolve()
+        # As for pkg_resources, a marker that holds without the extra puts
+        # the requirement in base.
+        self.assertEqual(['nothing', 'testdep', 'either'], base)
+        self.assertEqual({
+            'extra': ['extra', 'both[x]>=1', 'neither'],
+            'other_thing': ['both[x]>=1'],
+            'absent': [],
+            }, extras)
+
+    def test_markers_evaluated_once(self):
+        calls = []
+
+        class Marker(object):
+            def evaluate(self, environment):
+                calls.append(environment['extra'])
+                return True
+        evaluator = reqindex.MarkerEvaluator()
+        marker = Marker()
+        for _ in range(3):
+            self.assertTrue(evaluator.evaluate(marker, 'a', key='m'))
+            self.assertTrue(evaluator.evaluate(marker, key='m'))
+        self.assertEqual(['a', None], calls)
+
+    def test_matches_pkg_resources(self):
+        self.useFixture(fixtures.MonkeyPatch('sys.stderr', sys.stderr))
+        project = self.useFixture(ScaleProject(
+            extras=5, requirements=60, resolvable=False))
+        build = AbstractBuildSystem(project.path)
+        metadata = build.metadata()
+        base, extras = build.requirement_index().resolve()
+
+        def strip(reqs):
+            # pkg_resources may keep markers; the index drops them.
+            return set(str(r).split(';')[0] for r in reqs)
+        self.assertEqual(strip(metadata.requires()), set(base))
+        self.assertEqual(sorted(metadata.extras), sorted(extras))
+        for extra in metadata.extras:
+            expected = strip(metadata.requires([extra]))
+            self.assertEqual(expected - set(base), set(extras[extra]))
@@ -0,0 +1,53 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sys
+import zipfile
+
+import fixtures
+from testtools import TestCase
+
+from setuptools_shim.main import AbstractBuildSystem
+from setuptools_shim.tests.scale import ScaleProject
+
+
+class TestScaleProject(TestCase):
+
+    def setUp(self):
+        super(TestScaleProject, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch('sys.stderr', sys.stderr))
+
+    def test_metadata(self):
+        project = self.useFixture(ScaleProject(
+            extras=10, requirements=110, resolvable=False))
+        metadata = AbstractBuildSystem(project.path).metadata()
+        self.assertEqual(10, len(metadata.extras))
+        # 10 base requirements, 10 more per extra.
+        self.assertEqual(10, len(metadata.requires()))
+        self.assertEqual(20, len(metadata.requires(['extra3'])))
+
+    def test_build_requires(self):
+        project = self.useFixture(ScaleProject(build_requires=50))
+        reqs = AbstractBuildSystem(project.path).build_requires()
+        self.assertEqual(50, len(reqs))
+
+    def test_wheel(self):
+        project = self.useFixture(ScaleProject(files=100, wheel_size=100000))
+        outputdir = self.useFixture(fixtures.TempDir()).path
+        fname = AbstractBuildSystem(project.path).wheel(outputdir)
+        archive = zipfile.ZipFile(fname)
+        self.addCleanup(archive.close)
+        names = archive.namelist()
+        # 100 files + METADATA, WHEEL and RECORD.
+        self.assertEqual(103, len(names))
+        record = archive.read('scale-1.0.dist-info/RECORD')
+        self.assertEqual(103, len(record.splitlines()))
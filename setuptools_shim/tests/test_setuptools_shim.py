@@ -69,6 +69,9 @@ class Venv(fixtures.Fixture):
 
     :attr path: The path to the environment root.
     :attr python: The path to the python binary in the environment.
+    :attr cache_dir: SETUPTOOLS_SHIM_CACHE_DIR while the Venv is set up.
+        It does not exist, so the shim's caches are off unless a test
+        creates it; the user's own cache is never touched.
     """
 
     def __init__(self, reason):
@@ -87,8 +90,14 @@ class Venv(fixtures.Fixture):
             python, '-m', 'pip', 'install', '-U', 'pip<8', 'wheel']
         self.useFixture(CapturedSubprocess(
             'mkvenv-' + self._reason, command))
+        self.cache_dir = os.path.join(path, 'setuptools_shim-cache')
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_CACHE_DIR', self.cache_dir))
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SETUPTOOLS_SHIM_WORK_DIR'))
         self.addCleanup(delattr, self, 'path')
         self.addCleanup(delattr, self, 'python')
+        self.addCleanup(delattr, self, 'cache_dir')
         self.path = path
         self.python = python
 
@@ -400,3 +409,20 @@ class TestSetuptools_shim(ResourcedTestCase, TestCase):
         path = self.venv.path + '/lib/python%s.%s/site-packages/wheelinstalled.py' % sys.version_info[:2]
         with open(path, 'rt'):
             pass
+
+    def test_pip_7_install_scale(self):
+        # A large synthetic project through the same install path.
+        # (scale imports this module, so import it late.)
+        from setuptools_shim.tests.scale import ScaleProject
+        configure_mirror(self.sdistrepo, self.venv)
+        project = self.useFixture(ScaleProject(
+            files=500, wheel_size=5000000, extras=30, requirements=300,
+            build_requires=30))
+        self.useFixture(CapturedSubprocess('scale install',
+            [self.venv.python, '-m', 'pip', 'install', '--no-binary', ':all:',
+             project.path, '-vvv']))
+        path = self.venv.path + '/lib/python%s.%s/site-packages/scale/mod499.py' % sys.version_info[:2]
+        with open(path, 'rt'):
+            pass
+        self.useFixture(CapturedSubprocess('scale uninstall',
+            [self.venv.python, '-m', 'pip', 'uninstall', '-y', 'scale']))
@@ -0,0 +1,170 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import sys
+import threading
+import time
+
+import fixtures
+from testtools import TestCase, skipUnless
+
+from setuptools_shim import usage
+
+
+def _alive(pid):
+    """Is pid running (not gone, nor a zombie awaiting its reaper)?"""
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            return f.read().rsplit(')', 1)[1].split()[0] not in 'ZX'
+    except (IOError, OSError):
+        pass
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return not os.path.exists('/proc')
+
+
+class TestLimits(TestCase):
+
+    def test_from_environ(self):
+        limits = usage.Limits.from_environ({
+            'SETUPTOOLS_SHIM_CPU_LIMIT': '30',
+            'SETUPTOOLS_SHIM_MEMORY_LIMIT': '512',
+            })
+        self.assertEqual(30.0, limits.cpu)
+        self.assertEqual(512 * 1024 * 1024, limits.memory)
+        self.assertEqual(None, limits.wall)
+        self.assertTrue(limits)
+
+    def test_unset_is_unlimited(self):
+        self.assertFalse(usage.Limits.from_environ({}))
+
+
+class TestRun(TestCase):
+
+    def setUp(self):
+        super(TestRun, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch('sys.stderr', sys.stderr))
+        self.path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'usage.json')
+        self.env = dict(os.environ, SETUPTOOLS_SHIM_USAGE_FILE=self.path)
+
+    def test_records_usage(self):
+        cmd = [sys.executable, '-c', 'print("hi")']
+        out, used = usage.run(cmd, '.', self.env, limits=usage.Limits())
+        self.assertEqual(b'hi', out.strip())
+        self.assertEqual(0, used.returncode)
+        with open(self.path, 'rt') as source:
+            records = [json.loads(line) for line in source]
+        self.assertEqual(1, len(records))
+        self.assertEqual(cmd, records[0]['command'])
+        self.assertEqual(None, records[0]['killed'])
+        if hasattr(os, 'wait4'):
+            self.assertGreater(records[0]['maxrss'], 0)
+
+    def test_returncode(self):
+        cmd = [sys.executable, '-c', 'import sys; sys.exit(3)']
+        _, used = usage.run(cmd, '.', self.env, limits=usage.Limits())
+        self.assertEqual(3, used.returncode)
+
+    @skipUnless(os.name == 'posix', "limits are POSIX only")
+    def test_wall_limit_kills(self):
+        cmd = [sys.executable, '-c', 'import time; time.sleep(60)']
+        _, used = usage.run(
+            cmd, '.', self.env, limits=usage.Limits(wall=0.5))
+        self.assertEqual('wall', used.killed)
+        self.assertLess(used.wall, 30)
+
+    @skipUnless(os.name == 'posix', "limits are POSIX only")
+    def test_memory_limit_reported(self):
+        cmd = [sys.executable, '-c', 'x = bytearray(1024 * 1024 * 1024)']
+        _, used = usage.run(
+            cmd, '.', self.env, limits=usage.Limits(memory=256 * 1024 * 1024))
+        self.assertNotEqual(0, used.returncode)
+        self.assertEqual('memory', used.killed)
+
+    @skipUnless(os.name == 'posix', "limits are POSIX only")
+    def test_wall_limit_not_hit(self):
+        cmd = [sys.executable, '-c', 'pass']
+        _, used = usage.run(cmd, '.', self.env, limits=usage.Limits(wall=30))
+        self.assertEqual((0, None), (used.returncode, used.killed))
+
+    def test_terminate_after_reap(self):
+        killed = []
+        reaped = threading.Event()
+        reaped.set()
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.usage._killpg',
+            lambda proc, signum: self.fail("signalled a reaped process")))
+        usage._terminate(None, killed, threading.Lock(), reaped)
+        self.assertEqual([], killed)
+
+    @skipUnless(os.name == 'posix', "limits are POSIX only")
+    def test_interrupt_kills_backend(self):
+        pids = os.path.join(self.useFixture(fixtures.TempDir()).path, 'pids')
+        cmd = [sys.executable, '-c', (
+            'import os, subprocess, sys, time\n'
+            'child = subprocess.Popen([sys.executable, "-c",'
+            ' "import time; time.sleep(60)"])\n'
+            'with open(%r, "wt") as f:\n'
+            '    f.write("%%d %%d" %% (os.getpid(), child.pid))\n'
+            'time.sleep(60)\n') % pids]
+
+        def interrupted(*args):
+            # Once both processes are up, as if Ctrl-C hit the wait.
+            while True:
+                if os.path.exists(pids):
+                    with open(pids) as f:
+                        if len(f.read().split()) == 2:
+                            break
+                time.sleep(0.01)
+            raise KeyboardInterrupt()
+        self.useFixture(fixtures.MonkeyPatch(
+            'setuptools_shim.usage._reap', interrupted))
+        self.assertRaises(
+            KeyboardInterrupt, usage.run, cmd, '.', self.env, stdout=None,
+            limits=usage.Limits(wall=300))
+        with open(pids) as f:
+            backend, child = [int(pid) for pid in f.read().split()]
+        deadline = time.time() + 10
+        while _alive(backend) or _alive(child):
+            self.assertLess(time.time(), deadline, "backend left running")
+            time.sleep(0.05)
+
+    @skipUnless(os.name == 'posix', "limits are POSIX only")
+    def test_cpu_limit_reported(self):
+        cmd = [sys.executable, '-c', 'while True: pass']
+        _, used = usage.run(
+            cmd, '.', self.env, limits=usage.Limits(cpu=1, wall=30))
+        self.assertEqual('cpu', used.killed)
+
+
+class TestWrap(TestCase):
+
+    @skipUnless(os.name == 'posix', "limits are POSIX only")
+    def test_rlimits_use_wrapper(self):
+        command, new_session = usage.Limits(cpu=5, wall=10).wrap(['backend'])
+        self.assertEqual(sys.executable, command[0])
+        self.assertEqual(['5', '', 'backend'], command[-3:])
+        self.assertEqual(sys.version_info >= (3, 2), new_session)
+
+    @skipUnless(sys.version_info >= (3, 2), "needs start_new_session")
+    def test_wall_only_is_unwrapped(self):
+        self.assertEqual(
+            (['backend'], os.name == 'posix'),
+            usage.Limits(wall=10).wrap(['backend']))
+        self.assertEqual(
+            (['backend'], False), usage.Limits().wrap(['backend']))
+
@@ -0,0 +1,374 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Resource accounting and limits for backend processes.
+
+Configured through the environment:
+
+ - SETUPTOOLS_SHIM_USAGE_FILE: append one JSON object per backend
+   invocation to this file.
+ - SETUPTOOLS_SHIM_CPU_LIMIT: CPU seconds (user + sys) a backend may use.
+ - SETUPTOOLS_SHIM_MEMORY_LIMIT: address space, in MiB, a backend may use.
+ - SETUPTOOLS_SHIM_WALL_LIMIT: seconds a backend may run for.
+
+Limits are only enforced on POSIX platforms.
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# How long a backend gets between SIGTERM and SIGKILL when it overruns.
+KILL_GRACE = 5
+
+
+class Limits(object):
+    """Caps on a single backend invocation. None means unlimited.
+
+    :attr cpu: CPU seconds.
+    :attr memory: Address space in bytes.
+    :attr wall: Wall clock seconds.
+    """
+
+    def __init__(self, cpu=None, memory=None, wall=None):
+        self.cpu = cpu
+        self.memory = memory
+        self.wall = wall
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        if environ is None:
+            environ = os.environ
+
+        def get(name, scale=1):
+            value = environ.get('SETUPTOOLS_SHIM_%s_LIMIT' % name)
+            if not value:
+                return None
+            return float(value) * scale
+        memory = get('MEMORY', 1024 * 1024)
+        return cls(
+            cpu=get('CPU'), memory=int(memory) if memory else None,
+            wall=get('WALL'))
+
+    def __bool__(self):
+        return not (self.cpu is None and self.memory is None and
+                    self.wall is None)
+    __nonzero__ = __bool__
+
+    def wrap(self, cmd):
+        """Return (command, new_session) applying these limits to cmd.
+
+        preexec_fn is unsafe once threads are running, and backends are
+        run from executor and pool threads, so resource limits are applied
+        by a small Python wrapper that execs cmd in the same process. The
+        wall limit needs the backend in its own session, so that an overrun
+        kills every process it started; Popen's start_new_session does
+        that, or the wrapper on Pythons without it.
+        """
+        if os.name != 'posix':
+            return cmd, False
+        new_session = self.wall is not None
+        setsid = new_session and sys.version_info < (3, 2)
+        rlimits = resource is not None and (
+            self.cpu is not None or self.memory is not None)
+        if not (setsid or rlimits):
+            return cmd, new_session
+        cpu = ''
+        if self.cpu is not None and resource is not None:
+            # SIGXCPU at the soft limit, SIGKILL a second later.
+            cpu = str(int(self.cpu) or 1)
+        memory = ''
+        if self.memory is not None and resource is not None:
+            memory = str(self.memory)
+        return ([sys.executable, '-c', _WRAPPER, '1' if setsid else '',
+                 cpu, memory] + list(cmd), new_session and not setsid)
+
+
+# Run by Limits.wrap as: python -c _WRAPPER SETSID CPU MEMORY COMMAND...
+_WRAPPER = """\
+import os, sys
+setsid, cpu, memory = sys.argv[1:4]
+if setsid:
+    os.setsid()
+if cpu or memory:
+    import resource
+if cpu:
+    resource.setrlimit(resource.RLIMIT_CPU, (int(cpu), int(cpu) + 1))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (int(memory), int(memory)))
+try:
+    os.execvp(sys.argv[4], sys.argv[4:])
+except OSError as e:
+    sys.stderr.write("%s: %s\\n" % (sys.argv[4], e))
+    sys.exit(127)
+"""
+
+# Seen on stderr when a process fails to allocate under RLIMIT_AS.
+_MEMORY_ERRORS = (
+    b'MemoryError', b'Cannot allocate memory', b'std::bad_alloc',
+    b'out of memory', b'Out of memory')
+
+# How much of a backend's stderr to keep for _MEMORY_ERRORS.
+_TAIL = 64 * 1024
+
+
+class Usage(object):
+    """What one backend invocation cost.
+
+    :attr command: The command line run.
+    :attr wall: Wall clock seconds.
+    :attr user: User CPU seconds, or None if unavailable.
+    :attr sys: System CPU seconds, or None if unavailable.
+    :attr maxrss: Peak resident set size in KiB, or None if unavailable.
+    :attr returncode: The process return code (negative for signals).
+    :attr killed: None, or the name of the limit that killed the process.
+    """
+
+    def __init__(self, command, wall, returncode, rusage=None, killed=None):
+        self.command = command
+        self.wall = wall
+        self.returncode = returncode
+        self.killed = killed
+        if rusage is None:
+            self.user = self.sys = self.maxrss = None
+        else:
+            self.user = rusage.ru_utime
+            self.sys = rusage.ru_stime
+            self.maxrss = rusage.ru_maxrss
+            if sys.platform == 'darwin':
+                # bytes rather than KiB.
+                self.maxrss //= 1024
+
+    def as_dict(self):
+        return {
+            'command': self.command,
+            'wall': self.wall,
+            'user': self.user,
+            'sys': self.sys,
+            'maxrss': self.maxrss,
+            'returncode': self.returncode,
+            'killed': self.killed,
+            }
+
+    def __str__(self):
+        if self.user is None:
+            return "%.2fs wall" % self.wall
+        return "%.2fs wall, %.2fs user, %.2fs sys, %d KiB max RSS" % (
+            self.wall, self.user, self.sys, self.maxrss)
+
+
+def record(usage, environ=None):
+    """Log usage to stderr and the usage file, if one is configured."""
+    if environ is None:
+        environ = os.environ
+    sys.stderr.write("Finished %s: %s\n" % (" ".join(usage.command), usage))
+    path = environ.get('SETUPTOOLS_SHIM_USAGE_FILE')
+    if path:
+        with open(path, 'at') as output:
+            output.write(json.dumps(usage.as_dict(), sort_keys=True) + '\n')
+
+
+def _decode_status(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def run(cmd, cwd, env, stdout=subprocess.PIPE, limits=None):
+    """Run cmd to completion, measuring and limiting it.
+
+    :param limits: A Limits; defaults to Limits.from_environ().
+    :return: (output, Usage). output is None unless stdout is PIPE. The
+        usage has already been recorded.
+    :raises OSError: if the command could not be started.
+    """
+    if limits is None:
+        limits = Limits.from_environ()
+    command, new_session = limits.wrap(cmd)
+    kwargs = {}
+    if new_session:
+        kwargs['start_new_session'] = True
+    # With a memory limit, stderr is passed through a pipe so an allocation
+    # failure can be recognised.
+    stderr = subprocess.PIPE if limits.memory is not None else None
+    start = time.time()
+    proc = subprocess.Popen(
+        command, cwd=cwd, stdout=stdout, stdin=subprocess.PIPE,
+        stderr=stderr, env=env, **kwargs)
+    killed = []
+    lock = threading.Lock()
+    reaped = threading.Event()
+    timer = None
+    if limits.wall is not None:
+        timer = threading.Timer(
+            limits.wall, _terminate, (proc, killed, lock, reaped))
+        timer.daemon = True
+        timer.start()
+    tail = []
+    tee = None
+    if stderr is not None:
+        tee = threading.Thread(target=_tee, args=(proc.stderr, tail))
+        tee.daemon = True
+        tee.start()
+    try:
+        proc.stdin.close()
+        out = None
+        if stdout == subprocess.PIPE:
+            out = proc.stdout.read()
+            proc.stdout.close()
+        rusage = _reap(proc, lock, reaped, timer is not None)
+    except BaseException:
+        # E.g. KeyboardInterrupt: in its own session, the backend never saw
+        # the Ctrl-C, so it must not outlive us.
+        _kill(proc, limits.wall is not None)
+        raise
+    finally:
+        with lock:
+            reaped.set()
+        if timer is not None:
+            timer.cancel()
+    if tee is not None:
+        tee.join()
+        proc.stderr.close()
+    if killed:
+        why = killed[0]
+    else:
+        why = (_cpu_killed(limits, rusage, proc) or
+               _memory_killed(limits, proc, b''.join(tail)))
+    usage = Usage(cmd, time.time() - start, proc.returncode, rusage, why)
+    record(usage, env)
+    return out, usage
+
+
+def _reap(proc, lock, reaped, timed):
+    """Wait for proc to exit and reap it, returning its rusage or None.
+
+    reaped is set, under lock, before the process is reaped: from then on
+    its pid may be reused, and _terminate must not signal it.
+    """
+    if not hasattr(os, 'wait4'):
+        proc.wait()
+        with lock:
+            reaped.set()
+        return None
+    if timed:
+        if hasattr(os, 'waitid') and hasattr(os, 'WNOWAIT'):
+            # Wait for the exit, leaving the child a zombie so its pid
+            # stays reserved.
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        else:
+            while True:
+                with lock:
+                    pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+                    if pid:
+                        reaped.set()
+                        break
+                time.sleep(0.01)
+            proc.returncode = _decode_status(status)
+            return rusage
+    # Popen.wait would discard the child's rusage, so reap it ourselves
+    # and tell Popen it is done.
+    with lock:
+        reaped.set()
+        _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = _decode_status(status)
+    return rusage
+
+
+def _tee(source, tail):
+    """Copy source to our stderr, keeping its last _TAIL bytes in tail."""
+    output = getattr(sys.stderr, 'buffer', None)
+    kept = 0
+    for chunk in iter(lambda: os.read(source.fileno(), 65536), b''):
+        if output is not None:
+            output.write(chunk)
+            output.flush()
+        else:
+            sys.stderr.write(chunk.decode('utf-8', 'replace'))
+        tail.append(chunk)
+        kept += len(chunk)
+        while kept - len(tail[0]) >= _TAIL:
+            kept -= len(tail.pop(0))
+
+
+def _cpu_killed(limits, rusage, proc):
+    if limits.cpu is None or proc.returncode >= 0:
+        return None
+    if proc.returncode == -getattr(signal, 'SIGXCPU', 0):
+        return 'cpu'
+    if rusage is None:
+        return None
+    # The hard limit, a second after SIGXCPU; allow for rounding.
+    if rusage.ru_utime + rusage.ru_stime >= (int(limits.cpu) or 1) - 0.1:
+        return 'cpu'
+    return None
+
+
+def _memory_killed(limits, proc, tail):
+    if limits.memory is None or proc.returncode == 0:
+        return None
+    for marker in _MEMORY_ERRORS:
+        if marker in tail:
+            return 'memory'
+    return None
+
+
+def _terminate(proc, killed, lock, reaped):
+    with lock:
+        if reaped.is_set():
+            return
+        killed.append('wall')
+        _killpg(proc, signal.SIGTERM)
+    if reaped.wait(KILL_GRACE):
+        return
+    with lock:
+        if not reaped.is_set():
+            _killpg(proc, signal.SIGKILL)
+
+
+def _kill(proc, group):
+    """Kill and reap proc, unless it was already reaped.
+
+    :param group: proc leads its own process group, which is killed too.
+    """
+    # _reap sets returncode as soon as it has reaped the pid, after which
+    # the pid may be reused.
+    if proc.returncode is not None:
+        return
+    if group:
+        _killpg(proc, signal.SIGKILL)
+    else:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+    proc.wait()
+
+
+def _killpg(proc, signum):
+    try:
+        os.killpg(proc.pid, signum)
+    except AttributeError:
+        proc.send_signal(signum)
+    except OSError:
+        # Already gone.
+        pass